@@ -0,0 +1,59 @@
+import os
+import sys
+import json
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.curriculum import Curriculum
+
+def build_results(chapters, lectures_per_chapter):
+    results = []
+    for chapter_index in range(chapters):
+        results.append({'_class': 'chapter', 'id': chapter_index, 'title': f"Chapter {chapter_index}", 'object_index': chapter_index, 'is_published': True, 'sort_order': chapters * lectures_per_chapter + chapter_index})
+        for lecture_index in range(lectures_per_chapter):
+            lecture_id = chapter_index * lectures_per_chapter + lecture_index
+            asset = {'_class': 'asset', 'id': lecture_id, 'title': f"lecture-{lecture_id}.mp4", 'filename': f"lecture-{lecture_id}.mp4", 'asset_type': 'Video', 'status': 1, 'time_estimation': 600, 'is_external': False}
+            supplementary = {'_class': 'asset', 'id': lecture_id + 10 ** 7, 'title': f"slides-{lecture_id}.pdf", 'filename': f"slides-{lecture_id}.pdf", 'asset_type': 'File', 'status': 1, 'time_estimation': 0, 'is_external': False}
+            # Real curricula have a unique sort order and creation time per lecture, which keeps interning from sharing the extras
+            created = f"2024-01-01T{lecture_id // 3600 % 24:02d}:{lecture_id // 60 % 60:02d}:{lecture_id % 60:02d}Z"
+            results.append({'_class': 'lecture', 'id': lecture_id, 'title': f"Lecture {lecture_id}", 'object_index': lecture_index, 'is_published': True, 'sort_order': chapters * lectures_per_chapter - lecture_id, 'created': created, 'asset': asset, 'supplementary_assets': [supplementary], 'is_free': False})
+    return json.dumps(results)
+
+def organize_dicts(results):
+    # The nested-dict representation previously returned by Udemy.organize_curriculum
+    curriculum = []
+    current_chapter = None
+    for item in results:
+        if item['_class'] == 'chapter':
+            current_chapter = {'id': item['id'], 'title': item['title'], 'is_published': item['is_published'], 'children': []}
+            curriculum.append(current_chapter)
+        elif item['_class'] == 'lecture' and current_chapter is not None:
+            current_chapter['children'].append(item)
+    return curriculum
+
+def measure(payload, build):
+    tracemalloc.start()
+    curriculum = build(json.loads(payload))
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return curriculum, current
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory used by the dict and slots curriculum representations")
+    parser.add_argument("--chapters", type=int, default=100)
+    parser.add_argument("--lectures", type=int, default=50, help="Lectures per chapter")
+    args = parser.parse_args()
+
+    payload = build_results(args.chapters, args.lectures)
+
+    _, dict_bytes = measure(payload, organize_dicts)
+    curriculum, model_bytes = measure(payload, Curriculum.from_results)
+
+    print(f"Lectures: {curriculum.lecture_count}")
+    print(f"Nested dicts:     {dict_bytes / 1024 ** 2:8.2f} MB")
+    print(f"Curriculum model: {model_bytes / 1024 ** 2:8.2f} MB ({model_bytes / dict_bytes * 100:.0f}%)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BLOCK = os.urandom(1024 * 1024)
+
+class PayloadHandler(BaseHTTPRequestHandler):
+    size = 0
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(self.size))
+        self.end_headers()
+        remaining = self.size
+        while remaining > 0:
+            block = BLOCK[:min(remaining, len(BLOCK))]
+            self.wfile.write(block)
+            remaining -= len(block)
+
+    def log_message(self, format, *args):
+        pass
+
+def transfer_chunks(response, file):
+    # The per-chunk path previously used by download_mp4 and process_files
+    from utils.manifest import HashingWriter
+    writer = HashingWriter(file)
+    for chunk in response.iter_content(chunk_size=8192):
+        if chunk:
+            writer.write(chunk)
+    return writer
+
+def transfer_content(response, file):
+    # The whole-response path previously used by download_captions
+    from utils.manifest import HashingWriter
+    writer = HashingWriter(file)
+    writer.write(response.content)
+    return writer
+
+def transfer_buffer(response, file):
+    from utils.transfer import stream_to_file
+    return stream_to_file(response, file)
+
+MODES = {'chunks': transfer_chunks, 'content': transfer_content, 'buffer': transfer_buffer}
+
+def peak_rss():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def run_client(mode, url, transfers, buffer_size):
+    import requests
+    from utils.transfer import set_buffer_size
+    set_buffer_size(buffer_size)
+    transfer = MODES[mode]
+
+    def download(index, folder):
+        with requests.get(url, stream=True) as response:
+            response.raise_for_status()
+            with open(os.path.join(folder, f"{index}.bin"), 'wb') as file:
+                return transfer(response, file).size
+
+    with tempfile.TemporaryDirectory() as folder:
+        baseline_rss = peak_rss()
+        started_cpu = time.process_time()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=transfers) as executor:
+            total = sum(executor.map(download, range(transfers), [folder] * transfers))
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - started_cpu
+
+    print(json.dumps({'bytes': total, 'cpu': cpu, 'elapsed': elapsed, 'rss': peak_rss(), 'rss_growth': peak_rss() - baseline_rss}))
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CPU time and peak memory of the download write paths")
+    parser.add_argument("--size", type=int, default=256, help="Size in MB of each transfer")
+    parser.add_argument("--transfers", type=int, default=25, help="Number of concurrent transfers")
+    parser.add_argument("--buffer-size", type=int, default=1024, help="Buffer size in KB for the buffer mode")
+    parser.add_argument("--modes", type=str, default="chunks,content,buffer", help="Modes to compare, separated by commas")
+    parser.add_argument("--client", nargs=2, metavar=("MODE", "URL"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.client:
+        run_client(args.client[0], args.client[1], args.transfers, args.buffer_size * 1024)
+        return
+
+    PayloadHandler.size = args.size * 1024 ** 2
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PayloadHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/payload"
+
+    print(f"{args.transfers} transfers of {args.size} MB")
+    print(f"{'mode':<8} {'CPU s/GB':>9} {'MB/s':>8} {'peak RSS MB':>12} {'RSS growth MB':>14}")
+    try:
+        for mode in args.modes.split(","):
+            # Each mode runs in its own process so peak RSS is not shared between them
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--client", mode, url, "--transfers", str(args.transfers), "--buffer-size", str(args.buffer_size)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = json.loads(output)
+            gigabytes = result['bytes'] / 1024 ** 3
+            print(f"{mode:<8} {result['cpu'] / gigabytes:>9.2f} {result['bytes'] / 1024 ** 2 / result['elapsed']:>8.0f} {result['rss'] / 1024 ** 2:>12.1f} {result['rss_growth'] / 1024 ** 2:>14.1f}")
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
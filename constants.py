@@ -1,8 +1,15 @@
 import os
 import re
+import copy
+import json
 import time
+import queue
+import atexit
 import logging
 import argparse
+import threading
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
 from itertools import cycle
 from shutil import get_terminal_size
 from threading import Thread
@@ -19,10 +26,27 @@ ARTICLE_URL = "https://www.udemy.com/api-2.0/assets/{article_id}/?fields[asset]=
 HOME_DIR = os.getcwd()
 DOWNLOAD_DIR = os.path.join(HOME_DIR, "courses")
 
+# Used to project the size of streams whose Content-Length is unknown (~4 Mbit/s)
+ESTIMATED_BYTES_PER_SECOND = 500_000
+DISK_SPACE_POLL_INTERVAL = 30
+TRANSFER_BUFFER_SIZE = 1024 * 1024
+MANIFEST_FILE_NAME = "manifest.json"
+
+CACHE_DIR = os.path.join(HOME_DIR, "cache")
+# Lecture info without signed URL expiries is kept for an hour
+LECTURE_CACHE_DEFAULT_TTL = 3600
+LECTURE_CACHE_EXPIRY_MARGIN = 300
+COURSE_ID_CACHE_PATH = os.path.join(CACHE_DIR, "course_ids.json")
+PROFILE_DIR = os.path.join(HOME_DIR, "profiles")
+SCRATCH_DIR_NAME = ".scratch"
+
 LOG_DIR = os.path.join(HOME_DIR, "logs")
 os.makedirs(LOG_DIR, exist_ok=True)
 LOG_FILE_PATH = os.path.join(LOG_DIR, f"{time.strftime('%Y-%m-%d')}.log")
 
+LOG_FORMAT = '%(asctime)s %(levelname)s : %(message)s'
+LOG_CONTEXT_FIELDS = ('course_id', 'lecture_id', 'stage', 'duration')
+
 class LogFormatter(logging.Formatter):
     RESET = "\x1b[0m"
     COLOR_CODES = {
@@ -32,28 +56,98 @@ class LogFormatter(logging.Formatter):
         'CRITICAL': "\x1b[41m" # Red background
     }
 
+    def __init__(self, fmt=None, *args, **kwargs):
+        super().__init__(fmt, *args, **kwargs)
+        # One formatter per level, so records never have to be mutated to color them
+        self.level_formatters = {
+            level: logging.Formatter(fmt.replace('%(levelname)s', f"{color}%(levelname)s{self.RESET}"), *args, **kwargs)
+            for level, color in self.COLOR_CODES.items()
+        }
+
     def format(self, record):
-        original_levelname = record.levelname
-        
-        log_color = self.COLOR_CODES.get(record.levelname, self.RESET)
-        record.levelname = f"{log_color}{record.levelname}{self.RESET}"
-        
-        formatted_message = super().format(record)
-        
-        record.levelname = original_levelname
-        
-        return formatted_message
+        return self.level_formatters.get(record.levelname, super()).format(record)
+
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+        for field in LOG_CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        exception = record.exc_text or (self.formatException(record.exc_info) if record.exc_info else None)
+        if exception:
+            entry['exception'] = exception
+        return json.dumps(entry, ensure_ascii=False)
+
+class LogQueueHandler(QueueHandler):
+    exception_formatter = logging.Formatter()
+
+    def prepare(self, record):
+        # The default prepare folds the traceback into the message; keeping it in exc_text lets each formatter place it
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or self.exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+_log_context = threading.local()
+
+class LogContextFilter(logging.Filter):
+    # Runs in the emitting thread, before the record is handed to the background writer
+    def filter(self, record):
+        for field, value in getattr(_log_context, 'fields', {}).items():
+            if not hasattr(record, field):
+                setattr(record, field, value)
+        return True
+
+@contextmanager
+def log_context(**fields):
+    previous = getattr(_log_context, 'fields', {})
+    _log_context.fields = {**previous, **fields}
+    try:
+        yield
+    finally:
+        _log_context.fields = previous
+
+@contextmanager
+def log_stage(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        logger.debug(f"Finished {stage}", extra={'stage': stage, 'duration': round(time.perf_counter() - started, 3)})
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
+logger.setLevel(logging.DEBUG)
 
 console_handler = logging.StreamHandler()
-console_handler.setFormatter(LogFormatter('%(asctime)s %(levelname)s : %(message)s'))
-logger.addHandler(console_handler)
+console_handler.setLevel(logging.INFO)
+console_handler.setFormatter(LogFormatter(LOG_FORMAT))
 
 file_handler = logging.FileHandler(LOG_FILE_PATH)
-file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s : %(message)s'))
-logger.addHandler(file_handler)
+file_handler.setLevel(logging.INFO)
+file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+log_queue = queue.SimpleQueue()
+queue_handler = LogQueueHandler(log_queue)
+queue_handler.addFilter(LogContextFilter())
+logger.addHandler(queue_handler)
+
+log_listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+def use_json_log_file():
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(JsonLogFormatter())
 
 class LoadAction(argparse.Action):
     def __call__(self, parser, namespace, values, option_string=None):
@@ -107,30 +201,39 @@ class ElapsedTimeColumn(TextColumn):
         formatted_time = f"[yellow]{elapsed:.2f}s[/yellow]"
         return formatted_time
     
+EMOJI_PATTERN = re.compile(
+    "["
+    "\U0001F600-\U0001F64F"  # Emoticons
+    "\U0001F300-\U0001F5FF"  # Symbols & Pictographs
+    "\U0001F680-\U0001F6FF"  # Transport & Map Symbols
+    "\U0001F700-\U0001F77F"  # Alchemical Symbols
+    "\U0001F780-\U0001F7FF"  # Geometric Shapes Extended
+    "\U0001F800-\U0001F8FF"  # Supplemental Arrows-C
+    "\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
+    "\U0001FA00-\U0001FA6F"  # Chess Symbols
+    "\U0001FA70-\U0001FAFF"  # Symbols and Pictographs Extended-A
+    "\U00002702-\U000027B0"  # Dingbats
+    "\U000024C2-\U0001F251"  # Enclosed Characters
+    "]+", 
+    flags=re.UNICODE
+)
+
+OG_IMAGE_PATTERN = re.compile(r'<meta\s+property="og:image"\s+content="([^"]+)"')
+
 def remove_emojis_and_binary(text):
-    emoji_pattern = re.compile(
-        "["
-        "\U0001F600-\U0001F64F"  # Emoticons
-        "\U0001F300-\U0001F5FF"  # Symbols & Pictographs
-        "\U0001F680-\U0001F6FF"  # Transport & Map Symbols
-        "\U0001F700-\U0001F77F"  # Alchemical Symbols
-        "\U0001F780-\U0001F7FF"  # Geometric Shapes Extended
-        "\U0001F800-\U0001F8FF"  # Supplemental Arrows-C
-        "\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
-        "\U0001FA00-\U0001FA6F"  # Chess Symbols
-        "\U0001FA70-\U0001FAFF"  # Symbols and Pictographs Extended-A
-        "\U00002702-\U000027B0"  # Dingbats
-        "\U000024C2-\U0001F251"  # Enclosed Characters
-        "]+", 
-        flags=re.UNICODE
-    )
-
-    text = emoji_pattern.sub(r'', text)
+    text = EMOJI_PATTERN.sub(r'', text)
 
     text = ''.join(c for c in text if 32 <= ord(c) <= 126)
 
     return text
 
+def format_size(size):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
+
 def timestamp_to_seconds(timestamp):
     hours, minutes, seconds = timestamp.split(':')
     seconds, fraction = seconds.split('.')
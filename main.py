@@ -1,7 +1,9 @@
 import json
 import os
 import sys
+import asyncio
 import requests
+import shutil
 import argparse
 import subprocess
 from pathvalidate import sanitize_filename
@@ -13,7 +15,11 @@ from rich.text import Text
 from rich import print as rprint
 
 import re
+import atexit
+import codecs
+from urllib.parse import urlparse
 import http.cookiejar as cookielib
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from constants import *
@@ -23,6 +29,18 @@ from utils.process_captions import download_captions
 from utils.process_assets import download_supplementary_assets
 from utils.process_articles import download_article
 from utils.process_mp4 import download_mp4
+from utils.plan import build_download_plan, filter_plan, probe_plan_sizes, plan_to_dict, build_plan_table
+from utils.disk_space import open_disk_guard, disk_reservation, estimate_lecture_size
+from utils.manifest import Manifest, open_manifest, finalize_file, lecture_owns_file
+from utils.quality import QualityPolicy, parse_quality
+from utils.curriculum import Curriculum, Chapter, Lecture, Quiz
+from utils.lecture_cache import LectureInfoCache, is_refreshable_error
+from utils.async_client import AsyncUdemyClient
+from utils.course_ids import CourseIdCache
+from utils.profiler import enable_profiling, profiled, span
+from utils.transfer import set_buffer_size
+from utils.scratch import run_scratch_dir, sweep_stale_scratch, sweep_partial_files
+from utils.quizzes import QuizCache, quiz_page_urls, export_quiz
 
 console = Console()
 
@@ -32,31 +50,39 @@ class Udemy:
         try:
             cookie_jar = cookielib.MozillaCookieJar(cookie_path)
             cookie_jar.load()
+            self.cookies = cookie_jar
+            self.lecture_cache = None
+            self.quiz_cache = None
+            self.prefetched = {}
         except Exception as e:
             logger.critical(f"The provided cookie file could not be read or is incorrectly formatted. Please ensure the file is in the correct format and contains valid authentication cookies.")
             sys.exit(1)
     
     def request(self, url):
         try:
-            response = requests.get(url, cookies=cookie_jar, stream=True)
+            with span("http", urlparse(url).netloc):
+                response = requests.get(url, cookies=cookie_jar, stream=True)
             return response
         except Exception as e:
             logger.critical(f"There was a problem reaching the Udemy server. This could be due to network issues, an invalid URL, or Udemy being temporarily unavailable.")
 
     def extract_course_id(self, course_url):
+        course_ids = CourseIdCache(COURSE_ID_CACHE_PATH)
+        cached_id = course_ids.get(course_url)
+        if cached_id:
+            logger.info(f"Course ID Extracted: {cached_id} (cached)")
+            return cached_id
 
-        with Loader(f"Fetching course ID"):            
-            response = self.request(course_url)
-            content_str = response.content.decode('utf-8')
+        with Loader(f"Fetching course ID"):
+            image_url = self.find_og_image(course_url)
 
-        meta_match = re.search(r'<meta\s+property="og:image"\s+content="([^"]+)"', content_str)
-
-        if meta_match:
-            url = meta_match.group(1)
-            number_match = re.search(r'/(\d+)_', url)
+        if image_url:
+            number_match = re.search(r'/(\d+)_', image_url)
             if number_match:
                 number = number_match.group(1)
                 logger.info(f"Course ID Extracted: {number}")
+                course_ids.put(course_url, number)
+                course_ids.save()
                 return number
             else:
                 logger.critical("Unable to retrieve a valid course ID from the provided course URL. Please check the course URL or try with --id.")
@@ -64,6 +90,25 @@ class Udemy:
         else:
             logger.critical("Unable to retrieve a valid course ID from the provided course URL. Please check the course URL or try with --id")
             sys.exit(1)
+
+    def find_og_image(self, course_url):
+        # The meta tag sits in <head>, so the page is read only until it shows up
+        response = self.request(course_url)
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        buffer = ""
+
+        try:
+            for chunk in response.iter_content(chunk_size=16384):
+                buffer += decoder.decode(chunk)
+                meta_match = OG_IMAGE_PATTERN.search(buffer)
+                if meta_match:
+                    return meta_match.group(1)
+                # Keep enough of the tail for a tag split across chunks
+                buffer = buffer[-1024:]
+        finally:
+            response.close()
+
+        return None
         
     def fetch_course(self, course_id):
         try:
@@ -118,57 +163,185 @@ class Udemy:
             progress.update(task_id = task, description="Fetched Course Curriculum", total=total_count)
         return self.organize_curriculum(all_results)
     
-    def organize_curriculum(self, results):
-        curriculum = []
-        current_chapter = None
-
-        total_lectures = 0
-
-        for item in results:
-            if item['_class'] == 'chapter':
-                current_chapter = {
-                    'id': item['id'],
-                    'title': item['title'],
-                    'is_published': item['is_published'],
-                    'children': []
-                }
-                curriculum.append(current_chapter)
-            elif item['_class'] == 'lecture':
-                if current_chapter is not None:
-                    current_chapter['children'].append(item)
-                    if item['_class'] == 'lecture':
-                        total_lectures += 1
-                else:
-                    logger.warning("Found lecture without a parent chapter.")
+    def async_client(self):
+        return AsyncUdemyClient(self.cookies, metadata_concurrency)
+
+    async def run_async(self, method, *args):
+        async with self.async_client() as client:
+            return await method(client, *args)
+
+    async def async_fetch_course_curriculum(self, client, course_id):
+        url = CURRICULUM_URL.format(course_id=course_id)
+
+        logger.info("Fetching course curriculum. This may take a while")
+
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TextColumn("[progress.percentage]{task.percentage:>3}%"),
+            transient=True
+        ) as progress:
+            task = progress.add_task(description="Fetching Course Curriculum", total=0)
+
+            response = await client.get_json(url, allow_client_errors=True)
+
+            if response.get('detail') in ('You do not have permission to perform this action.', 'Not found.'):
+                progress.console.log("[red]The course was found, but the curriculum (lectures and materials) could not be retrieved. This could be due to API issues, restrictions on the course, or a malformed course structure.[/red]")
+                sys.exit(1)
+            if 'results' not in response:
+                raise Exception(response.get('detail', "The curriculum response did not contain any results"))
+
+            total_count = response.get('count', 0)
+            all_results = response['results']
+            progress.update(task, total=total_count, completed=len(all_results))
+
+            if response.get('next') and all_results:
+                # Every page is known once the first one reports the item count, so the rest are fetched at once
+                page_count = -(-total_count // len(all_results))
+                page_urls = [f"{url}&page={page}" for page in range(2, page_count + 1)]
+                pages = await client.gather_json(page_urls)
+
+                for page_url in page_urls:
+                    if pages[page_url] is None:
+                        raise Exception(f"Failed to fetch curriculum page {page_url}")
+                    all_results.extend(pages[page_url].get('results', []))
+                progress.update(task, completed=len(all_results))
+
+            progress.update(task_id = task, description="Fetched Course Curriculum", total=total_count)
+        return self.organize_curriculum(all_results)
 
-        num_chapters = len(curriculum)
+    def organize_curriculum(self, results):
+        curriculum = Curriculum.from_results(results, on_orphan=lambda item: logger.warning(f"Found {item['_class']} without a parent chapter."))
 
-        logger.info(f"Discovered Chapter(s): {num_chapters}")
-        logger.info(f"Discovered Lectures(s): {total_lectures}")
+        logger.info(f"Discovered Chapter(s): {len(curriculum)}")
+        logger.info(f"Discovered Lectures(s): {curriculum.lecture_count}")
+        logger.info(f"Discovered Quiz(zes): {curriculum.quiz_count}")
 
         return curriculum
 
     def build_curriculum_tree(self, data, tree, index=1):
         for i, item in enumerate(data, start=index):
-            if 'title' in item:
-                title = f"{i:02d}. {item['title']}"
-                if '_class' in item and item['_class'] == 'lecture':
-                    time_estimation = item.get('asset', {}).get('time_estimation')
-                    if time_estimation:
-                        time_str = format_time(time_estimation)
-                        title += f" ({time_str})"
-                    node_text = Text(title, style="cyan")
-                else:
-                    node_text = Text(title, style="magenta")
-                    
-                node = tree.add(node_text)
+            title = f"{i:02d}. {item.title}"
+            if isinstance(item, Quiz):
+                node_text = Text(f"Quiz {title}", style="yellow")
+            elif isinstance(item, Lecture):
+                if item.time_estimation:
+                    time_str = format_time(item.time_estimation)
+                    title += f" ({time_str})"
+                node_text = Text(title, style="cyan")
+            else:
+                node_text = Text(title, style="magenta")
                 
-                if 'children' in item:
-                    self.build_curriculum_tree(item['children'], node, index=1)
+            node = tree.add(node_text)
+            
+            if isinstance(item, Chapter):
+                self.build_curriculum_tree(item.children, node, index=1)
+                self.build_curriculum_tree(item.quizzes, node, index=1)
+
+    def get_lecture_info(self, course_id, lecture_id, refresh=False):
+        if self.lecture_cache is not None and not refresh:
+            lect_info = self.lecture_cache.get(lecture_id)
+            if lect_info is not None:
+                return lect_info
+
+        lect_info = self.request(LECTURE_URL.format(course_id=course_id, lecture_id=lecture_id)).json()
+        if self.lecture_cache is not None:
+            self.lecture_cache.put(lecture_id, lect_info)
+        return lect_info
+
+    async def async_fetch_lecture_info(self, client, course_id, lecture_id):
+        lect_info = await client.get_json(LECTURE_URL.format(course_id=course_id, lecture_id=lecture_id))
+        if self.lecture_cache is not None:
+            self.lecture_cache.put(lecture_id, lect_info)
+        return lect_info
+
+    def fetch_json(self, url):
+        prefetched = self.prefetched.pop(url, None)
+        if prefetched is not None:
+            return prefetched
+        return self.request(url).json()
+
+    async def async_fetch_json(self, client, urls):
+        results = await client.gather_json(urls)
+        self.prefetched.update({url: result for url, result in results.items() if result is not None})
+        return results
+
+    def get_quiz_assessments(self, quiz_id):
+        if self.quiz_cache is not None:
+            assessments = self.quiz_cache.get(quiz_id)
+            if assessments is not None:
+                return assessments
+
+        assessments = []
+        url = QUIZ_URL.format(quiz_id=quiz_id)
+        while url:
+            response = self.request(url)
+            response.raise_for_status()
+            page = response.json()
+            if 'results' not in page:
+                raise Exception(page.get('detail', "The response did not contain any assessments"))
+            assessments.extend(page['results'])
+            url = page.get('next')
+
+        if self.quiz_cache is not None:
+            self.quiz_cache.put(quiz_id, assessments)
+        return assessments
+
+    async def async_fetch_quiz_assessments(self, client, quiz_ids):
+        urls = {quiz_id: QUIZ_URL.format(quiz_id=quiz_id) for quiz_id in quiz_ids}
+        first_pages = await client.gather_json(list(urls.values()))
+
+        # Every quiz reports its assessment count on the first page, so the remaining pages of all quizzes are fetched at once
+        page_urls = {}
+        for quiz_id, url in urls.items():
+            page = first_pages[url]
+            if page and page.get('next') and page.get('results'):
+                page_urls[quiz_id] = quiz_page_urls(url, page.get('count', 0), len(page['results']))
+        pages = await client.gather_json([page_url for quiz_pages in page_urls.values() for page_url in quiz_pages])
+
+        for quiz_id, url in urls.items():
+            quiz_pages = [first_pages[url]] + [pages[page_url] for page_url in page_urls.get(quiz_id, ())]
+            if any(page is None or 'results' not in page for page in quiz_pages):
+                # Left uncached, the quiz is fetched again page by page when it is exported
+                continue
+            if self.quiz_cache is not None:
+                self.quiz_cache.put(quiz_id, [assessment for page in quiz_pages for assessment in page.get('results', [])])
+
+    async def async_prefetch_metadata(self, plan):
+        lecture_ids = []
+        urls = []
+
+        for item in plan.lectures:
+            lecture = item.lecture
+            if self.lecture_cache is None or self.lecture_cache.get(lecture.id) is None:
+                lecture_ids.append(lecture.id)
+            if "article" in item.artifacts:
+                urls.append(ARTICLE_URL.format(article_id=lecture.asset.id))
+            if "assets" in item.artifacts:
+                for asset in lecture.supplementary_assets:
+                    if asset.asset_type == 'File':
+                        urls.append(FILE_ASSET_URL.format(course_id=plan.course_id, lecture_id=lecture.id, asset_id=asset.id))
+                    elif asset.asset_type == 'ExternalLink':
+                        urls.append(LINK_ASSET_URL.format(course_id=plan.course_id, lecture_id=lecture.id, asset_id=asset.id))
+
+        quiz_ids = [item.quiz.id for item in plan.quizzes if self.quiz_cache is not None and self.quiz_cache.get(item.quiz.id) is None]
+
+        async with self.async_client() as client:
+            await asyncio.gather(
+                *(self.async_fetch_lecture_info(client, plan.course_id, lecture_id) for lecture_id in lecture_ids),
+                self.async_fetch_json(client, urls),
+                self.async_fetch_quiz_assessments(client, quiz_ids),
+                return_exceptions=True
+            )
+
+    def prefetch_metadata(self, plan):
+        with Loader("Fetching lecture metadata"):
+            asyncio.run(self.async_prefetch_metadata(plan))
 
-    def fetch_lecture_info(self, course_id, lecture_id):
+    def fetch_lecture_info(self, course_id, lecture_id, refresh=False):
         try:
-            return self.request(LECTURE_URL.format(course_id=course_id, lecture_id=lecture_id)).json()
+            return self.get_lecture_info(course_id, lecture_id, refresh)
         except Exception as e:
             logger.critical(f"Failed to fetch lecture info: {e}")
             sys.exit(1)
@@ -182,39 +355,81 @@ class Udemy:
             logger.error(f"Failed to create directory \"{path}\": {e}")
             sys.exit(1)
 
-    def download_lecture(self, course_id, lecture, lect_info, temp_folder_path, lindex, folder_path, task_id, progress):
-        if not skip_captions and len(lect_info["asset"]["captions"]) > 0:
-            download_captions(lect_info["asset"]["captions"], folder_path, f"{lindex}. {sanitize_filename(lecture['title'])}", captions, convert_to_srt)
+    def download_lecture(self, course_id, item, lect_info, task_id, progress, reservation=None):
+        with disk_reservation(reservation), log_context(course_id=course_id, lecture_id=item.lecture.id), log_stage("lecture"):
+            try:
+                try:
+                    self.download_lecture_artifacts(course_id, item, lect_info, task_id, progress)
+                except Exception as e:
+                    if not is_refreshable_error(e):
+                        raise
+                    for asset in item.lecture.supplementary_assets:
+                        self.prefetched.pop(FILE_ASSET_URL.format(course_id=course_id, lecture_id=item.lecture.id, asset_id=asset.id), None)
+                    logger.warning(f"The media links for \"{item.lecture.title}\" may have expired ({e}). Refreshing the lecture info and retrying.")
+                    lect_info = self.fetch_lecture_info(course_id, item.lecture.id, refresh=True)
+                    self.download_lecture_artifacts(course_id, item, lect_info, task_id, progress)
+            except Exception as e:
+                # A failed lecture must not stop the rest of the course
+                logger.error(f"Failed to download \"{item.lecture.title}\": {e}")
+                progress.console.log(f"[red]Error Downloading {remove_emojis_and_binary(item.lecture.title)}[/red] ✕")
+            finally:
+                shutil.rmtree(item.temp_folder_path, ignore_errors=True)
+
+        try:
+            progress.remove_task(task_id)
+        except KeyError:
+            pass
+
+    def download_lecture_artifacts(self, course_id, item, lect_info, task_id, progress):
+        lecture = item.lecture
+
+        if "captions" in item.artifacts and len(lect_info["asset"]["captions"]) > 0:
+            with log_stage("captions"):
+                download_captions(lect_info["asset"]["captions"], item.temp_folder_path, item.folder_path, item.output_name, captions, convert_to_srt)
 
-        if not skip_assets and len(lecture["supplementary_assets"]) > 0:
-            download_supplementary_assets(self, lecture["supplementary_assets"], folder_path, course_id, lect_info["id"])
+        if "assets" in item.artifacts:
+            with log_stage("assets"):
+                download_supplementary_assets(self, lecture.supplementary_assets, item.temp_folder_path, item.folder_path, course_id, lect_info["id"])
 
-        if not skip_lectures and lect_info['asset']['asset_type'] == "Video":
-            mpd_url = next((item['src'] for item in lect_info['asset']['media_sources'] if item['type'] == "application/dash+xml"), None)
-            mp4_url = next((item['src'] for item in lect_info['asset']['media_sources'] if item['type'] == "video/mp4"), None)
-            m3u8_url = next((item['src'] for item in lect_info['asset']['media_sources'] if item['type'] == "application/x-mpegURL"), None)
+        if "video" in item.artifacts and lect_info['asset']['asset_type'] == "Video":
+            mpd_url = next((source['src'] for source in lect_info['asset']['media_sources'] if source['type'] == "application/dash+xml"), None)
+            mp4_url = next((source['src'] for source in lect_info['asset']['media_sources'] if source['type'] == "video/mp4"), None)
+            m3u8_url = next((source['src'] for source in lect_info['asset']['media_sources'] if source['type'] == "application/x-mpegURL"), None)
             
             if mpd_url is None:
                 if m3u8_url is None:
                     if mp4_url is None:
                         logger.error(f"This lecture appears to be served in different format. We currently do not support downloading this format. Please create an issue on GitHub if you need this feature.")
                     else:
-                        download_mp4(mp4_url, temp_folder_path, f"{lindex}. {sanitize_filename(lecture['title'])}", task_id, progress)
+                        with log_stage("video"):
+                            download_mp4(mp4_url, item.temp_folder_path, item.folder_path, item.output_name, task_id, progress)
                 else:
-                    download_and_merge_m3u8(m3u8_url, temp_folder_path, f"{lindex}. {sanitize_filename(lecture['title'])}", task_id, progress)
+                    with log_stage("video"):
+                        download_and_merge_m3u8(m3u8_url, item.temp_folder_path, item.folder_path, item.output_name, item.duration, quality_policy, task_id, progress)
             else:
                 if key is None:
                     logger.warning("The video appears to be DRM-protected, and it may not play without a valid Widevine decryption key.")
-                download_and_merge_mpd(mpd_url, temp_folder_path, f"{lindex}. {sanitize_filename(lecture['title'])}", lecture['asset']['time_estimation'], key, task_id, progress)
-        elif not skip_articles and lect_info['asset']['asset_type'] == "Article":
-            download_article(self, lect_info['asset'], temp_folder_path, f"{lindex}. {sanitize_filename(lecture['title'])}", task_id, progress)
-
-        try:
-            progress.remove_task(task_id)
-        except KeyError:
-            pass
-
-    def download_course(self, course_id, curriculum):
+                with log_stage("video"):
+                    download_and_merge_mpd(mpd_url, item.temp_folder_path, item.folder_path, item.output_name, item.duration, key, task_id, progress)
+        elif "article" in item.artifacts and lect_info['asset']['asset_type'] == "Article":
+            with log_stage("article"):
+                download_article(self, lect_info['asset'], item.temp_folder_path, item.folder_path, item.output_name, task_id, progress)
+
+    def export_quizzes(self, plan):
+        with Loader(f"Exporting {len(plan.quizzes)} quiz(zes)"), ThreadPoolExecutor(max_workers=max_concurrent_lectures) as executor:
+            futures = {executor.submit(self.get_quiz_assessments, item.quiz.id): item for item in plan.quizzes}
+
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    assessments = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to export quiz \"{item.quiz.title}\": {e}")
+                    continue
+                export_quiz(item.quiz, assessments, item.temp_path)
+                finalize_file(item.temp_path, os.path.join(item.folder_path, f"{item.output_name}.json"))
+
+    def download_course(self, plan):
         progress = Progress(
             SpinnerColumn(),
             TextColumn("[progress.description]{task.description}"),
@@ -222,75 +437,77 @@ class Udemy:
             TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
             ElapsedTimeColumn(),
         )
-        
-        tasks = {}
-        futures = []
-
-        with ThreadPoolExecutor(max_workers=max_concurrent_lectures) as executor, Live(progress, refresh_per_second=10):
-            task_generator = (
-                (f"{mindex:02}" if mindex < 10 else f"{mindex}", 
-                chapter, 
-                f"{lindex:02}" if lindex < 10 else f"{lindex}", 
-                lecture)
-                for mindex, chapter in enumerate(curriculum, start=1)
-                if is_valid_chapter(mindex, start_chapter, end_chapter)
-                for lindex, lecture in enumerate(chapter['children'], start=1)
-                if is_valid_lecture(mindex, lindex, start_chapter, start_lecture, end_chapter, end_lecture)
-            )
 
-            for _ in range(max_concurrent_lectures):
-                try:
-                    mindex, chapter, lindex, lecture = next(task_generator)
-                    folder_path = os.path.join(COURSE_DIR, f"{mindex}. {remove_emojis_and_binary(sanitize_filename(chapter['title']))}")
-                    temp_folder_path = os.path.join(folder_path, str(lecture['id']))
-                    self.create_directory(temp_folder_path)
-                    lect_info = self.fetch_lecture_info(course_id, lecture['id'])
-                    
+        self.create_directory(plan.course_dir)
+        for folder_path in plan.folders:
+            self.create_directory(folder_path)
+
+        sweep_stale_scratch(os.path.dirname(plan.scratch_dir))
+        sweep_partial_files(plan)
+        self.create_directory(plan.scratch_dir)
+
+        manifest = open_manifest(plan.course_dir, plan.course_id)
+
+        try:
+            guard = open_disk_guard(plan.course_dir, disk_reserve)
+            futures = []
+            pending = deque(plan.lectures)
+
+            with ThreadPoolExecutor(max_workers=max_concurrent_lectures) as executor, Live(progress, refresh_per_second=10):
+                def submit_next():
+                    if not pending:
+                        return False
+
+                    item = pending[0]
+                    size = estimate_lecture_size(item)
+                    reservation = guard.reserve_space(size)
+                    if reservation is None:
+                        if futures:
+                            # Retried once one of the running lectures finishes
+                            return False
+                        reservation = guard.wait_for_reservation(size)
+                    pending.popleft()
+
+                    self.create_directory(item.temp_folder_path)
+                    lect_info = self.fetch_lecture_info(plan.course_id, item.lecture.id)
+
                     task_id = progress.add_task(
-                        f"Downloading Lecture: {lecture['title']} ({lindex}/{len(chapter['children'])})", 
+                        f"Downloading Lecture: {item.lecture.title} ({item.lecture_index}/{item.chapter_lectures})", 
                         total=100
                     )
-                    tasks[task_id] = (lecture, lect_info, temp_folder_path, lindex, folder_path)
-                    
-                    future = executor.submit(
-                        self.download_lecture, course_id, lecture, lect_info, temp_folder_path, lindex, folder_path, task_id, progress
-                    )
 
+                    future = executor.submit(profiled(self.download_lecture), plan.course_id, item, lect_info, task_id, progress, reservation)
                     futures.append((task_id, future))
-                except StopIteration:
-                    break
+                    return True
 
-            while futures:
-                for future in as_completed(f[1] for f in futures):
-                    task_id = next(task_id for task_id, f in futures if f == future)
-                    future.result()
-                    try:
-                        progress.remove_task(task_id)
-                    except:
-                        pass
-                    futures = [f for f in futures if f[1] != future]
+                for _ in range(max_concurrent_lectures):
+                    if not submit_next():
+                        break
 
-                    try:
-                        mindex, chapter, lindex, lecture = next(task_generator)
-                        folder_path = os.path.join(COURSE_DIR, f"{mindex}. {sanitize_filename(chapter['title'])}")
-                        temp_folder_path = os.path.join(folder_path, str(lecture['id']))
-                        self.create_directory(temp_folder_path)
-                        lect_info = self.fetch_lecture_info(course_id, lecture['id'])
-
-                        task_id = progress.add_task(
-                            f"Downloading Lecture: {lecture['title']} ({lindex}/{len(chapter['children'])})",
-                            total=100
-                        )
-                        tasks[task_id] = (lecture, lect_info, temp_folder_path, lindex, folder_path)
-
-                        future = executor.submit(
-                            self.download_lecture, course_id, lecture, lect_info, temp_folder_path, lindex, folder_path, task_id, progress
-                        )
-
-                        futures.append((task_id, future))
-                    except StopIteration:
+                while futures:
+                    for future in as_completed(f[1] for f in futures):
+                        task_id, _ = next(f for f in futures if f[1] == future)
+                        future.result()
+                        try:
+                            progress.remove_task(task_id)
+                        except:
+                            pass
+                        futures = [f for f in futures if f[1] != future]
+
+                        while len(futures) < max_concurrent_lectures and submit_next():
+                            pass
                         break
 
+            if plan.quizzes:
+                self.export_quizzes(plan)
+        finally:
+            manifest.save()
+            shutil.rmtree(plan.scratch_dir, ignore_errors=True)
+            if self.lecture_cache is not None:
+                self.lecture_cache.save()
+            if self.quiz_cache is not None:
+                self.quiz_cache.save()
+
 def check_prerequisites():
     if not cookie_path:
         if not os.path.isfile(os.path.join(HOME_DIR, "cookies.txt")):
@@ -318,7 +535,7 @@ def check_prerequisites():
 def main():
 
     try:
-        global course_url, key, cookie_path, COURSE_DIR, captions, max_concurrent_lectures, skip_captions, skip_assets, skip_lectures, skip_articles, skip_assignments, convert_to_srt, start_chapter, end_chapter, start_lecture, end_lecture
+        global course_url, key, cookie_path, COURSE_DIR, captions, max_concurrent_lectures, skip_captions, skip_assets, skip_lectures, skip_articles, skip_assignments, skip_quizzes, convert_to_srt, disk_reserve, quality_policy, metadata_concurrency, start_chapter, end_chapter, start_lecture, end_lecture
 
         parser = argparse.ArgumentParser(description="Udemy Course Downloader")
         parser.add_argument("--id", "-i", type=int, required=False, help="The ID of the Udemy course to download")
@@ -328,8 +545,14 @@ def main():
         parser.add_argument("--load", "-l", help="Load course curriculum from file", action=LoadAction, const=True, nargs='?')
         parser.add_argument("--save", "-s", help="Save course curriculum to a file", action=LoadAction, const=True, nargs='?')
         parser.add_argument("--concurrent", "-cn", type=int, default=4, help="Maximum number of concurrent downloads")
+        parser.add_argument("--metadata-concurrency", type=int, default=100, help="Maximum number of concurrent metadata requests")
+        parser.add_argument("--scratch-dir", type=str, help="Directory for temporary download data, e.g. a local disk when the output is on network storage. Finished files are moved into the course folder")
+        parser.add_argument("--buffer-size", type=int, default=TRANSFER_BUFFER_SIZE // 1024, help="Size in KB of the buffer each download reads into and writes from")
+        parser.add_argument("--reserve", type=float, default=1, help="Free disk space in GB to keep available. Downloads pause when the projected usage would exceed it")
         
-        # parser.add_argument("--quality", "-q", type=str, help="Specify the quality of the videos to download.")
+        parser.add_argument("--quality", "-q", type=str, help="Maximum video resolution height to download, e.g. 720 or 720p")
+        parser.add_argument("--max-bitrate", type=int, help="Maximum video bitrate in kbps to download")
+        parser.add_argument("--max-mb-per-minute", type=float, help="Maximum megabytes per minute of video to download")
         parser.add_argument("--start-chapter", type=int, help="Start the download from the specified chapter")
         parser.add_argument("--start-lecture", type=int, help="Start the download from the specified lecture")
         parser.add_argument("--end-chapter", type=int, help="End the download at the specified chapter")
@@ -338,18 +561,30 @@ def main():
         parser.add_argument("--srt", help="Convert the captions to srt format", action=LoadAction, const=True, nargs='?')
         
         parser.add_argument("--tree", help="Create a tree view of the course curriculum", action=LoadAction, nargs='?')
+        parser.add_argument("--verify", help="Verify downloaded files against the course manifest and re-download only the lectures that fail", action=LoadAction, nargs='?')
+        parser.add_argument("--log-format", choices=["text", "json"], default="text", help="Format of the log file. The json format adds course, lecture, stage and duration fields")
+        parser.add_argument("--profile", help="Profile the run and write CPU, stack and wait-time reports at exit. Optionally provide the report directory", action=LoadAction, nargs='?')
+        parser.add_argument("--plan", "--dry-run", dest="plan", help="Show the download plan with size and duration estimates without downloading. Optionally save it to a file", action=LoadAction, nargs='?')
 
         parser.add_argument("--skip-captions", type=bool, default=False, help="Skip downloading captions", action=LoadAction, nargs='?')
         parser.add_argument("--skip-assets", type=bool, default=False, help="Skip downloading assets", action=LoadAction, nargs='?')
         parser.add_argument("--skip-lectures", type=bool, default=False, help="Skip downloading lectures", action=LoadAction, nargs='?')
         parser.add_argument("--skip-articles", type=bool, default=False, help="Skip downloading articles", action=LoadAction, nargs='?')
         parser.add_argument("--skip-assignments", type=bool, default=False, help="Skip downloading assignments", action=LoadAction, nargs='?')
+        parser.add_argument("--skip-quizzes", type=bool, default=False, help="Skip exporting quizzes and practice tests", action=LoadAction, nargs='?')
         
         args = parser.parse_args()
 
         if len(sys.argv) == 1:
             print(parser.format_help())
             sys.exit(0)
+
+        if args.log_format == "json":
+            use_json_log_file()
+
+        if args.profile:
+            profile_dir = args.profile if args.profile is not True else os.path.join(PROFILE_DIR, time.strftime('%Y-%m-%d_%H-%M-%S'))
+            atexit.register(enable_profiling(profile_dir).write_report)
         course_url = args.url
 
         key = args.key
@@ -363,6 +598,20 @@ def main():
         else:
             max_concurrent_lectures = args.concurrent
 
+        disk_reserve = int(max(args.reserve, 0) * 1024 ** 3)
+        metadata_concurrency = max(args.metadata_concurrency, 1)
+        set_buffer_size(args.buffer_size * 1024)
+
+        try:
+            quality_policy = QualityPolicy(
+                max_height=parse_quality(args.quality) if args.quality else None,
+                max_bitrate=args.max_bitrate * 1000 if args.max_bitrate else None,
+                max_bytes_per_minute=int(args.max_mb_per_minute * 1024 ** 2) if args.max_mb_per_minute else None
+            )
+        except ValueError:
+            logger.error("Invalid quality provided. Quality should be a resolution height such as 720 or 720p.")
+            return
+
         if not course_url and not args.id:
             logger.error("You must provide either the course ID with '--id' or the course URL with '--url' to proceed.")
             return
@@ -399,28 +648,30 @@ def main():
         skip_lectures = args.skip_lectures
         skip_articles = args.skip_articles
         skip_assignments = args.skip_assignments
+        skip_quizzes = args.skip_quizzes
 
         course_info = udemy.fetch_course(course_id)
         COURSE_DIR = os.path.join(DOWNLOAD_DIR, remove_emojis_and_binary(sanitize_filename(course_info['title'])))
 
         logger.info(f"Course Title: {course_info['title']}")
 
-        udemy.create_directory(os.path.join(COURSE_DIR))
+        udemy.lecture_cache = LectureInfoCache(os.path.join(CACHE_DIR, f"lectures-{course_id}.json"))
+        udemy.quiz_cache = QuizCache(os.path.join(CACHE_DIR, f"quizzes-{course_id}.json"))
 
         if args.load:
             if args.load is True and os.path.isfile(os.path.join(HOME_DIR, "course.json")):
                 try:
-                    course_curriculum = json.load(open(os.path.join(HOME_DIR, "course.json"), "r"))
+                    course_curriculum = Curriculum.from_json(json.load(open(os.path.join(HOME_DIR, "course.json"), "r")))
                     logger.info(f"The course curriculum is successfully loaded from course.json")
-                except json.JSONDecodeError:
+                except (json.JSONDecodeError, KeyError, TypeError):
                     logger.error("The course curriculum file provided is either malformed or corrupted.")
                     sys.exit(1)
             elif args.load:
                 if os.path.isfile(args.load):
                     try:
-                        course_curriculum = json.load(open(args.load, "r"))
+                        course_curriculum = Curriculum.from_json(json.load(open(args.load, "r")))
                         logger.info(f"The course curriculum is successfully loaded from {args.load}")
-                    except json.JSONDecodeError:
+                    except (json.JSONDecodeError, KeyError, TypeError):
                         logger.error("The course curriculum file provided is either malformed or corrupted.")
                         sys.exit(1)
                 else:
@@ -431,23 +682,27 @@ def main():
                 sys.exit(1)
         else:
             try:
-                course_curriculum = udemy.fetch_course_curriculum(course_id)
+                course_curriculum = asyncio.run(udemy.run_async(udemy.async_fetch_course_curriculum, course_id))
             except Exception as e:
-                logger.critical(f"Unable to retrieve the course curriculum. {e}")
-                sys.exit(1)
+                logger.warning(f"Fetching the course curriculum concurrently failed ({e}). Retrying page by page.")
+                try:
+                    course_curriculum = udemy.fetch_course_curriculum(course_id)
+                except Exception as e:
+                    logger.critical(f"Unable to retrieve the course curriculum. {e}")
+                    sys.exit(1)
 
         if args.save:
             if args.save is True:
                 if (os.path.isfile(os.path.join(HOME_DIR, "course.json"))):
                     logger.warning("Course curriculum file already exists. Overwriting the existing file.")
                 with open(os.path.join(HOME_DIR, "course.json"), "w") as f:
-                    json.dump(course_curriculum, f, indent=4)
+                    json.dump(course_curriculum.to_json(), f, indent=4)
                     logger.info(f"The course curriculum has been successfully saved to course.json")
             elif args.save:
                 if (os.path.isfile(args.save)):
                     logger.warning("Course curriculum file already exists. Overwriting the existing file.")
                 with open(args.save, "w") as f:
-                    json.dump(course_curriculum, f, indent=4)
+                    json.dump(course_curriculum.to_json(), f, indent=4)
                     logger.info(f"The course curriculum has been successfully saved to {args.save}")
 
         if args.tree:
@@ -496,16 +751,62 @@ def main():
             end_chapter = len(course_curriculum)
             end_lecture = 1000
 
+        download_plan = build_download_plan(
+            course_id, course_curriculum, COURSE_DIR, run_scratch_dir(args.scratch_dir or os.path.join(DOWNLOAD_DIR, SCRATCH_DIR_NAME)), start_chapter, start_lecture, end_chapter, end_lecture,
+            skip_captions=skip_captions, skip_assets=skip_assets, skip_lectures=skip_lectures, skip_articles=skip_articles, skip_quizzes=skip_quizzes
+        )
+
+        if args.plan:
+            udemy.prefetch_metadata(download_plan)
+            with Loader("Estimating download size"):
+                download_plan = probe_plan_sizes(udemy, download_plan, max_concurrent_lectures, quality_policy)
+            udemy.lecture_cache.save()
+            udemy.quiz_cache.save()
+
+            rprint(build_plan_table(download_plan, course_info['title']))
+            if quality_policy.is_limited() and quality_policy.streams:
+                logger.info(quality_policy.summary())
+            if args.plan is not True:
+                if (os.path.isfile(args.plan)):
+                    logger.warning("Download plan file already exists. Overwriting the existing file.")
+                with open(args.plan, "w") as f:
+                    json.dump(plan_to_dict(download_plan), f, indent=4)
+                    logger.info(f"The download plan has been successfully saved to {args.plan}")
+            return
+
+        if args.verify:
+            if not os.path.isfile(os.path.join(COURSE_DIR, MANIFEST_FILE_NAME)):
+                logger.error("No download manifest was found for this course. Please download the course before verifying it.")
+                sys.exit(1)
+
+            manifest = Manifest(COURSE_DIR, course_id)
+            with Loader("Verifying downloaded files"):
+                failures = manifest.verify(max_concurrent_lectures)
+
+            for path, reason in failures.items():
+                logger.warning(f"Verification failed for {path}: {reason}")
+            logger.info(f"Verified {len(manifest.files)} file(s). {len(failures)} file(s) failed verification.")
+
+            if not failures:
+                return
+
+            download_plan = filter_plan(download_plan, lambda item: any(lecture_owns_file(item, path, COURSE_DIR) for path in failures))
+            logger.info(f"Re-downloading {len(download_plan.lectures)} lecture(s) that failed verification.")
+
         logger.info("The course download is starting. Please wait while the materials are being downloaded.")
 
         start_time = time.time()
-        udemy.download_course(course_id, course_curriculum)
+        udemy.prefetch_metadata(download_plan)
+        udemy.download_course(download_plan)
         end_time = time.time()
 
         elapsed_time = end_time - start_time
         
         logger.info(f"Download finished in {format_time(elapsed_time)}")
 
+        if quality_policy.is_limited() and quality_policy.streams:
+            logger.info(quality_policy.summary())
+
         logger.info("All course materials have been successfully downloaded.")    
         logger.info("Download Complete.")
     except KeyboardInterrupt:
@@ -0,0 +1,48 @@
+import asyncio
+import aiohttp
+from http.cookies import SimpleCookie
+from yarl import URL
+
+class AsyncUdemyClient:
+    def __init__(self, cookie_jar, concurrency):
+        self.cookie_jar = cookie_jar
+        self.concurrency = concurrency
+        self.session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300)
+        )
+        self.load_cookies()
+        return self
+
+    def load_cookies(self):
+        # Each cookie keeps its domain and path, so it is only sent where the sync requests session would send it
+        for cookie in self.cookie_jar:
+            domain = cookie.domain.lstrip(".")
+            morsels = SimpleCookie()
+            morsels[cookie.name] = cookie.value
+            morsels[cookie.name]['path'] = cookie.path or "/"
+            if cookie.domain_specified:
+                morsels[cookie.name]['domain'] = domain
+            if cookie.secure:
+                morsels[cookie.name]['secure'] = True
+            self.session.cookie_jar.update_cookies(morsels, URL(f"https://{domain}/"))
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        await self.session.close()
+
+    async def get_json(self, url, allow_client_errors=False):
+        async with self._semaphore:
+            async with self.session.get(url) as response:
+                # Udemy explains 4xx responses in a JSON 'detail' field, which some callers report to the user
+                if not (allow_client_errors and 400 <= response.status < 500):
+                    response.raise_for_status()
+                return await response.json(content_type=None)
+
+    async def gather_json(self, urls):
+        # Failed lookups are returned as None so callers can fall back to the threaded path
+        results = await asyncio.gather(*(self.get_json(url) for url in urls), return_exceptions=True)
+        return {url: (None if isinstance(result, BaseException) else result) for url, result in zip(urls, results)}
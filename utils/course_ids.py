@@ -0,0 +1,38 @@
+import os
+import json
+import threading
+from urllib.parse import urlparse
+from constants import logger
+
+def normalize_course_url(course_url):
+    parsed = urlparse(course_url if "://" in course_url else f"https://{course_url}")
+    host = parsed.netloc.lower().removeprefix("www.")
+    return f"{host}{parsed.path.rstrip('/')}"
+
+class CourseIdCache:
+    def __init__(self, path):
+        self.path = path
+        self.ids = {}
+        self._lock = threading.Lock()
+
+        if os.path.isfile(path):
+            try:
+                with open(path, "r") as f:
+                    self.ids = json.load(f)
+            except json.JSONDecodeError:
+                logger.warning("The course ID cache is malformed and will be rebuilt.")
+
+    def get(self, course_url):
+        with self._lock:
+            return self.ids.get(normalize_course_url(course_url))
+
+    def put(self, course_url, course_id):
+        with self._lock:
+            self.ids[normalize_course_url(course_url)] = str(course_id)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            data = json.dumps(self.ids, indent=4)
+        with open(self.path, "w") as f:
+            f.write(data)
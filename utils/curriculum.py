@@ -0,0 +1,217 @@
+import sys
+import json
+
+MISSING_KEY = "\0missing"
+
+def _split_fields(data, fields):
+    extra = {key: value for key, value in data.items() if key not in fields}
+    # Fields absent from the source are remembered so to_dict does not write them back as null
+    missing = [field for field in fields if field not in data]
+    if missing:
+        extra[MISSING_KEY] = missing
+    # Rarely used fields are kept as a single JSON string and only decoded on access.
+    # Interning shares the string between items with identical extras (e.g. most assets)
+    return sys.intern(json.dumps(extra, separators=(",", ":"))) if extra else None
+
+def _load_extra(raw):
+    extra = json.loads(raw) if raw else {}
+    return extra, extra.pop(MISSING_KEY, ())
+
+def _to_dict(fields, values, raw_extra):
+    extra, missing = _load_extra(raw_extra)
+    data = {field: value for field, value in zip(fields, values) if field not in missing}
+    data.update(extra)
+    return data
+
+class Asset:
+    __slots__ = ('id', 'asset_type', 'filename', 'title', 'time_estimation', '_extra')
+    FIELDS = ('id', 'asset_type', 'filename', 'title', 'time_estimation')
+
+    def __init__(self, id, asset_type=None, filename=None, title=None, time_estimation=None, _extra=None):
+        self.id = id
+        self.asset_type = asset_type
+        self.filename = filename
+        self.title = title
+        self.time_estimation = time_estimation
+        self._extra = _extra
+
+    @property
+    def extra(self):
+        return _load_extra(self._extra)[0]
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(*(data.get(field) for field in cls.FIELDS), _extra=_split_fields(data, cls.FIELDS))
+
+    def to_dict(self):
+        return _to_dict(self.FIELDS, (getattr(self, field) for field in self.FIELDS), self._extra)
+
+class Lecture:
+    __slots__ = ('id', 'title', 'object_index', 'asset', 'supplementary_assets', '_extra')
+    FIELDS = ('id', 'title', 'object_index', 'asset', 'supplementary_assets')
+
+    def __init__(self, id, title, object_index=None, asset=None, supplementary_assets=(), _extra=None):
+        self.id = id
+        self.title = title
+        self.object_index = object_index
+        self.asset = asset
+        self.supplementary_assets = tuple(supplementary_assets)
+        self._extra = _extra
+
+    @property
+    def extra(self):
+        return _load_extra(self._extra)[0]
+
+    @property
+    def asset_type(self):
+        return self.asset.asset_type if self.asset else None
+
+    @property
+    def time_estimation(self):
+        return (self.asset.time_estimation if self.asset else None) or 0
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data['id'],
+            data.get('title'),
+            data.get('object_index'),
+            Asset.from_dict(data['asset']) if data.get('asset') else None,
+            tuple(Asset.from_dict(asset) for asset in data.get('supplementary_assets') or ()),
+            _extra=_split_fields(data, cls.FIELDS)
+        )
+
+    def to_dict(self):
+        return _to_dict(self.FIELDS, (
+            self.id,
+            self.title,
+            self.object_index,
+            self.asset.to_dict() if self.asset else None,
+            [asset.to_dict() for asset in self.supplementary_assets]
+        ), self._extra)
+
+class Quiz:
+    __slots__ = ('id', 'title', 'object_index', 'quiz_type', 'lecture_position', '_extra')
+    FIELDS = ('id', 'title', 'object_index', 'type', 'lecture_position')
+
+    def __init__(self, id, title, object_index=None, quiz_type=None, lecture_position=None, _extra=None):
+        self.id = id
+        self.title = title
+        self.object_index = object_index
+        self.quiz_type = quiz_type
+        # Number of lectures before the quiz in its chapter, used to apply lecture ranges to quizzes
+        self.lecture_position = lecture_position
+        self._extra = _extra
+
+    @property
+    def extra(self):
+        return _load_extra(self._extra)[0]
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data.get('title'), data.get('object_index'), data.get('type'), data.get('lecture_position'), _extra=_split_fields(data, cls.FIELDS))
+
+    def to_dict(self):
+        data = _to_dict(self.FIELDS, (self.id, self.title, self.object_index, self.quiz_type, self.lecture_position), self._extra)
+        # Assigned from the curriculum order rather than read from the source, so it is always kept
+        if self.lecture_position is not None:
+            data['lecture_position'] = self.lecture_position
+        return data
+
+class Chapter:
+    __slots__ = ('id', 'title', 'is_published', 'children', 'quizzes')
+
+    def __init__(self, id, title, is_published=True, children=None, quizzes=None):
+        self.id = id
+        self.title = title
+        self.is_published = is_published
+        self.children = children if children is not None else []
+        # Quizzes are numbered separately from lectures, so they are kept apart to leave lecture numbering unchanged
+        self.quizzes = quizzes if quizzes is not None else []
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data['id'],
+            data['title'],
+            data.get('is_published', True),
+            [Lecture.from_dict(item) for item in data.get('children', [])],
+            [Quiz.from_dict(item) for item in data.get('quizzes', [])]
+        )
+
+    def to_dict(self):
+        data = {'id': self.id, 'title': self.title, 'is_published': self.is_published, 'children': [item.to_dict() for item in self.children]}
+        if self.quizzes:
+            data['quizzes'] = [item.to_dict() for item in self.quizzes]
+        return data
+
+class Curriculum:
+    __slots__ = ('chapters', '_lectures', '_chapters_by_lecture', '_quizzes')
+
+    def __init__(self, chapters):
+        self.chapters = chapters
+        self._lectures = {}
+        self._chapters_by_lecture = {}
+        self._quizzes = {}
+
+        for chapter in chapters:
+            for item in chapter.children:
+                self._lectures[item.id] = item
+                self._chapters_by_lecture[item.id] = chapter
+            for quiz in chapter.quizzes:
+                self._quizzes[quiz.id] = quiz
+
+    def __iter__(self):
+        return iter(self.chapters)
+
+    def __len__(self):
+        return len(self.chapters)
+
+    def __getitem__(self, index):
+        return self.chapters[index]
+
+    @property
+    def lecture_count(self):
+        return len(self._lectures)
+
+    @property
+    def quiz_count(self):
+        return len(self._quizzes)
+
+    def quiz(self, quiz_id):
+        return self._quizzes.get(quiz_id)
+
+    def lecture(self, lecture_id):
+        return self._lectures.get(lecture_id)
+
+    def chapter_of(self, lecture_id):
+        return self._chapters_by_lecture.get(lecture_id)
+
+    @classmethod
+    def from_results(cls, results, on_orphan=None):
+        chapters = []
+        current_chapter = None
+
+        for item in results:
+            if item['_class'] == 'chapter':
+                current_chapter = Chapter(item['id'], item['title'], item['is_published'])
+                chapters.append(current_chapter)
+            elif item['_class'] in ('lecture', 'quiz'):
+                if current_chapter is None:
+                    if on_orphan is not None:
+                        on_orphan(item)
+                elif item['_class'] == 'lecture':
+                    current_chapter.children.append(Lecture.from_dict(item))
+                else:
+                    quiz = Quiz.from_dict(item)
+                    quiz.lecture_position = len(current_chapter.children)
+                    current_chapter.quizzes.append(quiz)
+
+        return cls(chapters)
+
+    @classmethod
+    def from_json(cls, data):
+        return cls([Chapter.from_dict(chapter) for chapter in data])
+
+    def to_json(self):
+        return [chapter.to_dict() for chapter in self.chapters]
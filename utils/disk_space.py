@@ -0,0 +1,153 @@
+import os
+import time
+import shutil
+import threading
+from contextlib import contextmanager
+from constants import logger, format_size, ESTIMATED_BYTES_PER_SECOND, DISK_SPACE_POLL_INTERVAL
+
+FOLDER_USAGE_INTERVAL = 2
+
+_guard = None
+_current = threading.local()
+
+def estimate_lecture_size(item):
+    if item.size is not None:
+        return item.size
+    if "video" in item.artifacts:
+        return item.duration * ESTIMATED_BYTES_PER_SECOND
+    return 0
+
+def preallocate(file, size):
+    if size <= 0:
+        return
+    claim_disk_space(file.name, size)
+    try:
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(file.fileno(), 0, size)
+        else:
+            file.truncate(size)
+    except OSError:
+        # Not every filesystem supports preallocation, the download still works without it
+        pass
+
+def folder_size(folder_path):
+    size = 0
+    for root, _, files in os.walk(folder_path):
+        for file_name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, file_name))
+            except OSError:
+                pass
+    return size
+
+class Reservation:
+    __slots__ = ('size', 'remaining')
+
+    def __init__(self, size):
+        self.size = size
+        self.remaining = size
+
+class DiskSpaceGuard:
+    def __init__(self, path, reserve, poll_interval=DISK_SPACE_POLL_INTERVAL):
+        self.path = path
+        self.reserve = reserve
+        self.poll_interval = poll_interval
+        self.device = os.stat(path).st_dev
+        # Projected bytes of running lectures that are not yet written or allocated on disk
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def available(self):
+        return shutil.disk_usage(self.path).free - self.reserve - self.in_flight
+
+    def on_device(self, path):
+        try:
+            return os.stat(path).st_dev == self.device
+        except OSError:
+            return False
+
+    def admit(self, size):
+        with self._lock:
+            if size <= self.available():
+                self.in_flight += size
+                return True
+            return False
+
+    def release(self, size):
+        with self._lock:
+            self.in_flight -= size
+
+    def reserve_space(self, size):
+        return Reservation(size) if self.admit(size) else None
+
+    def claim(self, reservation, size):
+        # Bytes that reached the disk no longer count as projected, they are already missing from the free space
+        with self._lock:
+            covered = min(size, reservation.remaining)
+            reservation.remaining -= covered
+            self.in_flight -= covered
+        excess = size - covered
+        if excess > 0:
+            if not self.admit(excess):
+                self.wait_for_space(excess)
+            self.release(excess)
+
+    def finish(self, reservation):
+        with self._lock:
+            self.in_flight -= reservation.remaining
+            reservation.remaining = 0
+
+    def wait_for_space(self, size):
+        if size > shutil.disk_usage(self.path).total - self.reserve:
+            logger.warning(f"The next download ({format_size(size)}) is larger than the disk can hold with the reserve. Continuing without waiting for free space.")
+            with self._lock:
+                self.in_flight += size
+            return
+
+        logger.warning(f"Not enough free disk space for the next download ({format_size(size)} needed, {format_size(max(self.available(), 0))} available). Downloads are paused until space is freed.")
+        while not self.admit(size):
+            time.sleep(self.poll_interval)
+        logger.info("Enough free disk space is available again. Resuming downloads.")
+
+    def wait_for_reservation(self, size):
+        self.wait_for_space(size)
+        return Reservation(size)
+
+def open_disk_guard(path, reserve):
+    global _guard
+    _guard = DiskSpaceGuard(path, reserve)
+    return _guard
+
+@contextmanager
+def disk_reservation(reservation):
+    _current.reservation = reservation
+    try:
+        yield
+    finally:
+        _current.reservation = None
+        if _guard is not None and reservation is not None:
+            _guard.finish(reservation)
+
+def claim_disk_space(path, size):
+    reservation = getattr(_current, 'reservation', None)
+    if _guard is None or reservation is None or size <= 0 or not _guard.on_device(path):
+        return
+    _guard.claim(reservation, size)
+
+class FolderUsage:
+    # Claims the growth of a folder filled by an external tool such as n_m3u8dl-re or ffmpeg
+    def __init__(self, folder_path, interval=FOLDER_USAGE_INTERVAL):
+        self.folder_path = folder_path
+        self.interval = interval
+        self.claimed = folder_size(folder_path)
+        self.checked = time.monotonic()
+
+    def poll(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.checked < self.interval:
+            return
+        self.checked = now
+        used = folder_size(self.folder_path)
+        if used > self.claimed:
+            claim_disk_space(self.folder_path, used - self.claimed)
+            self.claimed = used
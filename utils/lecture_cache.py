@@ -0,0 +1,79 @@
+import os
+import re
+import json
+import time
+import threading
+import requests
+from urllib.parse import unquote
+from constants import logger, LECTURE_CACHE_DEFAULT_TTL, LECTURE_CACHE_EXPIRY_MARGIN
+
+EXPIRY_PATTERN = re.compile(r'(?:^|[?&~;/])(?:Expires|expires|exp|e)=(\d{9,11})(?=$|[&~;/])')
+EXPIRED_STATUS_CODES = (401, 403, 410)
+
+def signed_urls(lect_info):
+    asset = lect_info.get('asset') or {}
+    for source in asset.get('media_sources') or []:
+        yield source.get('src') or ""
+    for caption in asset.get('captions') or []:
+        yield caption.get('url') or ""
+
+def url_expiry(url):
+    expiries = [int(value) for value in EXPIRY_PATTERN.findall(unquote(url))]
+    return min(expiries) if expiries else None
+
+def lecture_info_expiry(lect_info, now=None):
+    now = now or time.time()
+    expiries = [expiry for expiry in map(url_expiry, signed_urls(lect_info)) if expiry is not None]
+    if not expiries:
+        return now + LECTURE_CACHE_DEFAULT_TTL
+    return min(expiries) - LECTURE_CACHE_EXPIRY_MARGIN
+
+class StreamDownloadError(Exception):
+    pass
+
+def is_expired_url_error(error):
+    return isinstance(error, requests.HTTPError) and error.response is not None and error.response.status_code in EXPIRED_STATUS_CODES
+
+def is_refreshable_error(error):
+    # n_m3u8dl-re only reports an expired stream URL as a failed exit, so stream failures are retried with fresh links too
+    return is_expired_url_error(error) or isinstance(error, StreamDownloadError)
+
+class LectureInfoCache:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+
+        if os.path.isfile(path):
+            try:
+                with open(path, "r") as f:
+                    self.entries = json.load(f)
+            except json.JSONDecodeError:
+                logger.warning("The lecture info cache is malformed and will be rebuilt.")
+        self.prune()
+
+    def prune(self):
+        now = time.time()
+        with self._lock:
+            self.entries = {key: entry for key, entry in self.entries.items() if entry['expires'] > now}
+
+    def get(self, lecture_id):
+        with self._lock:
+            entry = self.entries.get(str(lecture_id))
+        if entry is None or entry['expires'] <= time.time():
+            return None
+        return entry['info']
+
+    def put(self, lecture_id, lect_info):
+        if not lect_info.get('asset'):
+            return
+        with self._lock:
+            self.entries[str(lecture_id)] = {'expires': lecture_info_expiry(lect_info), 'info': lect_info}
+
+    def save(self):
+        self.prune()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            data = json.dumps(self.entries)
+        with open(self.path, "w") as f:
+            f.write(data)
@@ -0,0 +1,116 @@
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from constants import logger, MANIFEST_FILE_NAME
+from utils.scratch import finalize
+
+HASH_ALGORITHM = "sha256"
+HASH_BLOCK_SIZE = 1024 * 1024
+
+_manifest = None
+
+class HashingWriter:
+    def __init__(self, file):
+        self.file = file
+        self.hash = hashlib.new(HASH_ALGORITHM)
+        self.size = 0
+
+    def write(self, data):
+        self.file.write(data)
+        self.hash.update(data)
+        self.size += len(data)
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+class Manifest:
+    def __init__(self, course_dir, course_id=None):
+        self.course_dir = course_dir
+        self.path = os.path.join(course_dir, MANIFEST_FILE_NAME)
+        self.course_id = course_id
+        self.files = {}
+        self._lock = threading.Lock()
+
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+                self.files = data.get('files', {})
+                self.course_id = self.course_id or data.get('course_id')
+            except json.JSONDecodeError:
+                logger.warning("The existing download manifest is malformed and will be rebuilt.")
+
+    def relative_path(self, file_path):
+        return os.path.relpath(file_path, self.course_dir).replace(os.sep, "/")
+
+    def record(self, file_path, digest, size):
+        with self._lock:
+            self.files[self.relative_path(file_path)] = {HASH_ALGORITHM: digest, 'size': size}
+
+    def save(self):
+        with self._lock:
+            data = {'course_id': self.course_id, 'algorithm': HASH_ALGORITHM, 'files': dict(sorted(self.files.items()))}
+        with open(self.path, "w") as f:
+            json.dump(data, f, indent=4)
+
+    def verify_file(self, relative_path):
+        entry = self.files[relative_path]
+        file_path = os.path.join(self.course_dir, *relative_path.split("/"))
+
+        if not os.path.isfile(file_path):
+            return "missing"
+        if os.path.getsize(file_path) != entry['size']:
+            return "size mismatch"
+        if hash_file(file_path)[0] != entry[HASH_ALGORITHM]:
+            return "checksum mismatch"
+        return None
+
+    def verify(self, max_workers):
+        paths = list(self.files)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(self.verify_file, paths)
+            return {path: result for path, result in zip(paths, results) if result is not None}
+
+def hash_file(file_path):
+    file_hash = hashlib.new(HASH_ALGORITHM)
+    size = 0
+    with open(file_path, 'rb') as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            file_hash.update(block)
+            size += len(block)
+    return file_hash.hexdigest(), size
+
+def open_manifest(course_dir, course_id=None):
+    global _manifest
+    _manifest = Manifest(course_dir, course_id)
+    return _manifest
+
+def record_file(file_path, digest=None, size=None):
+    if _manifest is None:
+        return
+    if digest is None:
+        digest, size = hash_file(file_path)
+    _manifest.record(file_path, digest, size)
+
+def finalize_file(source_path, destination_path, digest=None, size=None):
+    # Hashed while still in scratch, so the output tree is never read back
+    if _manifest is not None and digest is None:
+        digest, size = hash_file(source_path)
+    record_file(finalize(source_path, destination_path), digest, size)
+
+def lecture_owns_file(item, relative_path, course_dir):
+    file_path = os.path.join(course_dir, *relative_path.split("/"))
+    folder_path, file_name = os.path.split(file_path)
+
+    if folder_path == item.folder_path:
+        return file_name.startswith(f"{item.output_name}.") or file_name.startswith(f"{item.output_name} - ")
+
+    if "assets" in item.artifacts:
+        for asset in item.lecture.supplementary_assets:
+            if folder_path == os.path.join(item.folder_path, "assets") and file_name == asset.filename:
+                return True
+            if folder_path == os.path.join(item.folder_path, "external-links") and file_name == f"{asset.filename}.url":
+                return True
+    return False
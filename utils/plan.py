@@ -0,0 +1,252 @@
+import os
+import m3u8
+import requests
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor
+from pathvalidate import sanitize_filename
+from rich.table import Table
+from utils.curriculum import Lecture, Quiz
+from constants import FILE_ASSET_URL, remove_emojis_and_binary, is_valid_chapter, is_valid_lecture, format_time, format_size
+
+class LecturePlan(NamedTuple):
+    chapter_index: str
+    lecture_index: str
+    chapter_title: str
+    chapter_lectures: int
+    lecture: Lecture
+    folder_path: str
+    temp_folder_path: str
+    output_name: str
+    artifacts: tuple
+    duration: int
+    size: int | None
+
+class QuizPlan(NamedTuple):
+    chapter_index: str
+    quiz_index: str
+    quiz: Quiz
+    folder_path: str
+    temp_path: str
+    output_name: str
+    artifacts: tuple = ("quiz",)
+
+class DownloadPlan(NamedTuple):
+    course_id: int
+    course_dir: str
+    scratch_dir: str
+    folders: tuple
+    lectures: tuple
+    duration: int
+    size: int
+    unknown_sizes: int
+    quizzes: tuple = ()
+
+def lecture_artifacts(lecture, skip_captions, skip_assets, skip_lectures, skip_articles):
+    artifacts = []
+    asset_type = lecture.asset_type
+
+    if asset_type == "Video":
+        if not skip_captions:
+            artifacts.append("captions")
+        if not skip_lectures:
+            artifacts.append("video")
+    elif asset_type == "Article" and not skip_articles:
+        artifacts.append("article")
+
+    if not skip_assets and lecture.supplementary_assets:
+        artifacts.append("assets")
+
+    return tuple(artifacts)
+
+def build_download_plan(course_id, curriculum, course_dir, scratch_dir, start_chapter, start_lecture, end_chapter, end_lecture,
+                        skip_captions=False, skip_assets=False, skip_lectures=False, skip_articles=False, skip_quizzes=False):
+    folders = []
+    lectures = []
+    quizzes = []
+
+    for mindex, chapter in enumerate(curriculum, start=1):
+        if not is_valid_chapter(mindex, start_chapter, end_chapter):
+            continue
+
+        chapter_index = f"{mindex:02}"
+        folder_path = os.path.join(course_dir, f"{chapter_index}. {remove_emojis_and_binary(sanitize_filename(chapter.title))}")
+        folder_added = False
+
+        for lindex, lecture in enumerate(chapter.children, start=1):
+            if not is_valid_lecture(mindex, lindex, start_chapter, start_lecture, end_chapter, end_lecture):
+                continue
+
+            artifacts = lecture_artifacts(lecture, skip_captions, skip_assets, skip_lectures, skip_articles)
+            if not artifacts:
+                continue
+
+            if not folder_added:
+                folders.append(folder_path)
+                folder_added = True
+
+            lecture_index = f"{lindex:02}"
+            lectures.append(LecturePlan(
+                chapter_index=chapter_index,
+                lecture_index=lecture_index,
+                chapter_title=chapter.title,
+                chapter_lectures=len(chapter.children),
+                lecture=lecture,
+                folder_path=folder_path,
+                temp_folder_path=os.path.join(scratch_dir, str(lecture.id)),
+                output_name=f"{lecture_index}. {sanitize_filename(lecture.title)}",
+                artifacts=artifacts,
+                duration=lecture.time_estimation,
+                size=None
+            ))
+
+        if skip_quizzes:
+            continue
+
+        for qindex, quiz in enumerate(chapter.quizzes, start=1):
+            # A quiz follows the range of the lecture before it; quizzes saved without a position only follow the chapter range
+            if quiz.lecture_position is not None and not is_valid_lecture(mindex, max(quiz.lecture_position, 1), start_chapter, start_lecture, end_chapter, end_lecture):
+                continue
+
+            if not folder_added:
+                folders.append(folder_path)
+                folder_added = True
+
+            quiz_index = f"{qindex:02}"
+            quizzes.append(QuizPlan(
+                chapter_index=chapter_index,
+                quiz_index=quiz_index,
+                quiz=quiz,
+                folder_path=folder_path,
+                temp_path=os.path.join(scratch_dir, f"quiz-{quiz.id}.json"),
+                output_name=f"Quiz {quiz_index}. {sanitize_filename(quiz.title or str(quiz.id))}"
+            ))
+
+    return summarize_plan(DownloadPlan(course_id, course_dir, scratch_dir, tuple(folders), tuple(lectures), 0, 0, 0, tuple(quizzes)))
+
+def summarize_plan(plan):
+    return plan._replace(
+        duration=sum(item.duration for item in plan.lectures),
+        size=sum(item.size for item in plan.lectures if item.size is not None),
+        unknown_sizes=sum(1 for item in plan.lectures if item.size is None)
+    )
+
+def filter_plan(plan, predicate):
+    lectures = tuple(item for item in plan.lectures if predicate(item))
+    quizzes = tuple(item for item in plan.quizzes if predicate(item))
+    folders = tuple(folder for folder in plan.folders if any(item.folder_path == folder for item in lectures + quizzes))
+    return summarize_plan(plan._replace(folders=folders, lectures=lectures, quizzes=quizzes))
+
+def head_content_length(url, cookies=None):
+    response = requests.head(url, cookies=cookies, allow_redirects=True)
+    response.raise_for_status()
+    length = response.headers.get('content-length')
+    return int(length) if length is not None else None
+
+def estimate_stream_size(m3u8_url, length, quality_policy):
+    response = requests.get(m3u8_url)
+    response.raise_for_status()
+
+    playlist = quality_policy.select(m3u8.loads(response.text).playlists, length)
+    if playlist is None:
+        return 0
+    return int((playlist.stream_info.bandwidth or 0) / 8 * length)
+
+def probe_lecture_size(udemy, course_id, item, quality_policy):
+    lecture = item.lecture
+    size = 0
+
+    try:
+        if "video" in item.artifacts:
+            lect_info = udemy.get_lecture_info(course_id, lecture.id)
+            media_sources = lect_info['asset']['media_sources']
+            mp4_url = next((source['src'] for source in media_sources if source['type'] == "video/mp4"), None)
+            m3u8_url = next((source['src'] for source in media_sources if source['type'] == "application/x-mpegURL"), None)
+            mpd_url = next((source['src'] for source in media_sources if source['type'] == "application/dash+xml"), None)
+
+            if mpd_url is None and m3u8_url is not None:
+                size += estimate_stream_size(m3u8_url, item.duration, quality_policy)
+            elif mpd_url is None and mp4_url is not None:
+                size += head_content_length(mp4_url) or 0
+            else:
+                # DASH sizes are only known once the segments are fetched
+                return None
+
+        if "assets" in item.artifacts:
+            for asset in lecture.supplementary_assets:
+                if asset.asset_type != 'File':
+                    continue
+                asset_info = udemy.fetch_json(FILE_ASSET_URL.format(course_id=course_id, lecture_id=lecture.id, asset_id=asset.id))
+                size += head_content_length(asset_info['download_urls']['File'][0]['file'], cookies=udemy.cookies) or 0
+    except Exception:
+        return None
+
+    return size
+
+def probe_plan_sizes(udemy, plan, max_workers, quality_policy):
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        sizes = list(executor.map(lambda item: probe_lecture_size(udemy, plan.course_id, item, quality_policy), plan.lectures))
+
+    lectures = tuple(item._replace(size=size) for item, size in zip(plan.lectures, sizes))
+    return summarize_plan(plan._replace(lectures=lectures))
+
+def plan_to_dict(plan):
+    return {
+        'course_id': plan.course_id,
+        'course_dir': plan.course_dir,
+        'duration': plan.duration,
+        'size': plan.size,
+        'unknown_sizes': plan.unknown_sizes,
+        'lectures': [
+            {
+                'id': item.lecture.id,
+                'title': item.lecture.title,
+                'chapter': item.chapter_title,
+                'folder_path': item.folder_path,
+                'output_name': item.output_name,
+                'artifacts': list(item.artifacts),
+                'duration': item.duration,
+                'size': item.size
+            }
+            for item in plan.lectures
+        ],
+        'quizzes': [
+            {
+                'id': item.quiz.id,
+                'title': item.quiz.title,
+                'type': item.quiz.quiz_type,
+                'folder_path': item.folder_path,
+                'output_name': item.output_name
+            }
+            for item in plan.quizzes
+        ]
+    }
+
+def build_plan_table(plan, title):
+    table = Table(title=title)
+    table.add_column("Chapter", style="magenta")
+    table.add_column("Lectures", justify="right")
+    table.add_column("Quizzes", justify="right")
+    table.add_column("Duration", justify="right")
+    table.add_column("Size", justify="right")
+
+    chapters = {folder_path: [os.path.basename(folder_path), 0, 0, 0, 0, 0] for folder_path in plan.folders}
+    for item in plan.lectures:
+        chapter = chapters[item.folder_path]
+        chapter[1] += 1
+        chapter[3] += item.duration
+        if item.size is None:
+            chapter[5] += 1
+        else:
+            chapter[4] += item.size
+    for item in plan.quizzes:
+        chapters[item.folder_path][2] += 1
+
+    for name, count, quiz_count, duration, size, unknown in chapters.values():
+        size_str = format_size(size) + (f" (+{unknown} unknown)" if unknown else "")
+        table.add_row(name, str(count), str(quiz_count), format_time(duration), size_str)
+
+    total_size = format_size(plan.size) + (f" (+{plan.unknown_sizes} unknown)" if plan.unknown_sizes else "")
+    table.add_section()
+    table.add_row("Total", str(len(plan.lectures)), str(len(plan.quizzes)), format_time(plan.duration), total_size, style="green")
+
+    return table
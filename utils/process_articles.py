@@ -1,19 +1,19 @@
 import os
-import shutil
 from urllib.parse import urlparse
 from constants import ARTICLE_URL
+from utils.manifest import finalize_file
 
-def download_article(udemy, article, download_folder_path, title_of_output_article, task_id, progress):
+def download_article(udemy, article, download_folder_path, output_folder_path, title_of_output_article, task_id, progress):
 
     progress.update(task_id,  description=f"Downloading Article {title_of_output_article}", completed=0)
 
     article_filename = f"{title_of_output_article}.html"
-    article_response = udemy.request(ARTICLE_URL.format(article_id=article['id'])).json()
+    article_response = udemy.fetch_json(ARTICLE_URL.format(article_id=article['id']))
 
-    with open(os.path.join(os.path.dirname(download_folder_path), article_filename), 'w', encoding='utf-8', errors='replace') as file:
+    article_path = os.path.join(download_folder_path, article_filename)
+    with open(article_path, 'w', encoding='utf-8', errors='replace') as file:
         file.write(article_response['body'])
+    finalize_file(article_path, os.path.join(output_folder_path, article_filename))
 
     progress.console.log(f"[green]Downloaded {title_of_output_article}[/green] ✓")
     progress.remove_task(task_id)
-
-    shutil.rmtree(download_folder_path)
\ No newline at end of file
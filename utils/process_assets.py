@@ -1,47 +1,54 @@
 import os
 from urllib.parse import urlparse
 from constants import LINK_ASSET_URL, FILE_ASSET_URL
+from utils.disk_space import preallocate
+from utils.manifest import finalize_file
+from utils.profiler import span
+from utils.transfer import stream_to_file
 
-def download_supplementary_assets(udemy, assets, download_folder_path, course_id, lecture_id):
+def download_supplementary_assets(udemy, assets, download_folder_path, output_folder_path, course_id, lecture_id):
     for asset in assets:
-        match asset['asset_type']:
+        match asset.asset_type:
             case 'File':
-                process_files(udemy, asset, course_id, lecture_id, download_folder_path)
+                process_files(udemy, asset, course_id, lecture_id, download_folder_path, output_folder_path)
             case 'ExternalLink':
-                process_external_links(udemy, asset, course_id, lecture_id, download_folder_path)
+                process_external_links(udemy, asset, course_id, lecture_id, download_folder_path, output_folder_path)
             case _:
                 pass
                 # Unsupported asset type. Please create a github issue if you'd like to add support for other types
 
-def process_files(udemy, asset, course_id, lecture_id, download_folder_path):
+def process_files(udemy, asset, course_id, lecture_id, download_folder_path, output_folder_path):
 
     assets_folder = os.path.join(download_folder_path, "assets")
     if not os.path.exists(assets_folder):
         os.makedirs(assets_folder)
     
-    asset_file_path = os.path.join(assets_folder, asset['filename'])
+    asset_file_path = os.path.join(assets_folder, asset.filename)
 
-    file_response = udemy.request(udemy.request(FILE_ASSET_URL.format(course_id=course_id, lecture_id=lecture_id, asset_id=asset['id'])).json()['download_urls']['File'][0]['file'])
+    with span("http", "asset transfer"):
+        file_response = udemy.request(udemy.fetch_json(FILE_ASSET_URL.format(course_id=course_id, lecture_id=lecture_id, asset_id=asset.id))['download_urls']['File'][0]['file'])
 
-    file_response.raise_for_status()
+        file_response.raise_for_status()
 
-    with open(asset_file_path, 'wb') as file:
-        for chunk in file_response.iter_content(chunk_size=8192):
-            if chunk:
-                file.write(chunk)
+        with open(asset_file_path, 'wb') as file:
+            preallocate(file, int(file_response.headers.get('content-length', 0)))
+            writer = stream_to_file(file_response, file)
+            file.truncate()
+    finalize_file(asset_file_path, os.path.join(output_folder_path, "assets", asset.filename), writer.hexdigest(), writer.size)
 
-def process_external_links(udemy, asset, course_id, lecture_id, download_folder_path):
+def process_external_links(udemy, asset, course_id, lecture_id, download_folder_path, output_folder_path):
 
     external_links_folder = os.path.join(download_folder_path, "external-links")
     if not os.path.exists(external_links_folder):
         os.makedirs(external_links_folder)
 
-    asset_filename = f"{asset['filename']}.url"
+    asset_filename = f"{asset.filename}.url"
     asset_file_path = os.path.join(external_links_folder, asset_filename)
 
-    response = udemy.request(LINK_ASSET_URL.format(course_id=course_id, lecture_id=lecture_id, asset_id=asset['id'])).json()
+    response = udemy.fetch_json(LINK_ASSET_URL.format(course_id=course_id, lecture_id=lecture_id, asset_id=asset.id))
 
     asset_url = response['external_url']
 
     with open(asset_file_path, 'w') as file:
-        file.write(f"[InternetShortcut]\nURL={asset_url}\n")
\ No newline at end of file
+        file.write(f"[InternetShortcut]\nURL={asset_url}\n")
+    finalize_file(asset_file_path, os.path.join(output_folder_path, "external-links", asset_filename))
\ No newline at end of file
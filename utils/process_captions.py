@@ -1,24 +1,30 @@
 import os
 import requests
 import webvtt
+from utils.manifest import finalize_file
+from utils.profiler import span
+from utils.transfer import stream_to_file
 
-def download_captions(captions, download_folder_path, title_of_output_mp4, captions_list, convert_to_srt):
+def download_captions(captions, download_folder_path, output_folder_path, title_of_output_mp4, captions_list, convert_to_srt):
     filtered_captions = [caption for caption in captions if caption["locale_id"] in captions_list]
 
     for caption in filtered_captions:
-        response = requests.get(caption['url'])
-        response.raise_for_status()
         if caption['file_name'].endswith('.vtt'):
             caption_name = f"{title_of_output_mp4} - {caption['video_label']}.vtt"
             vtt_path = os.path.join(download_folder_path, caption_name)
-            with open(vtt_path, 'wb') as file:
-                file.write(response.content)
+            with span("http", "captions"), requests.get(caption['url'], stream=True) as response:
+                response.raise_for_status()
+                with open(vtt_path, 'wb') as file:
+                    writer = stream_to_file(response, file)
 
             if convert_to_srt:
                 srt_name = caption_name.replace('.vtt', '.srt')
                 srt_path = os.path.join(download_folder_path, srt_name)
                 srt_content = webvtt.read(vtt_path)
                 srt_content.save_as_srt(srt_path)
+                finalize_file(srt_path, os.path.join(output_folder_path, srt_name))
+
+            finalize_file(vtt_path, os.path.join(output_folder_path, caption_name), writer.hexdigest(), writer.size)
                 
         else:
             print("Only VTT captions are supported. Please create a github issue if you'd like to add support for other formats.")
\ No newline at end of file
@@ -1,81 +1,83 @@
 import re
 import os
 import m3u8
-import shutil
 import requests
 import subprocess
 from constants import remove_emojis_and_binary
+from utils.manifest import finalize_file
+from utils.profiler import span
+from utils.disk_space import FolderUsage
+from utils.lecture_cache import StreamDownloadError
 
-def download_and_merge_m3u8(m3u8_file_url, download_folder_path, title_of_output_mp4, task_id, progress):
+def download_and_merge_m3u8(m3u8_file_url, download_folder_path, output_folder_path, title_of_output_mp4, length, quality_policy, task_id, progress):
     progress.update(task_id,  description=f"Downloading Stream {remove_emojis_and_binary(title_of_output_mp4)}", completed=0)
     
-    response = requests.get(m3u8_file_url)
-    response.raise_for_status()
+    with span("http", "hls playlist"):
+        response = requests.get(m3u8_file_url)
+        response.raise_for_status()
     
     m3u8_content = response.text
     m3u8_obj = m3u8.loads(m3u8_content)
     playlists = m3u8_obj.playlists
     
-    highest_quality_playlist = None
-    max_resolution = (0, 0)
-
     progress.update(task_id,  completed=99)
- 
-    for pl in playlists:
-        resolution = pl.stream_info.resolution
 
-        if resolution and (resolution[0] * resolution[1] > max_resolution[0] * max_resolution[1]):
-            highest_quality_playlist = pl
-            max_resolution = resolution
+    selected_playlist = quality_policy.select(playlists, length)
 
-    if not highest_quality_playlist:
+    if not selected_playlist:
         progress.console.log(f"No valid playlists {remove_emojis_and_binary(title_of_output_mp4)} ✕")
         progress.remove_task(task_id)
         return
     
-    highest_quality_url = highest_quality_playlist.uri
+    selected_url = selected_playlist.uri
 
-    highest_quality_response = requests.get(highest_quality_url)
+    with span("http", "hls playlist"):
+        selected_response = requests.get(selected_url)
+        selected_response.raise_for_status()
     m3u8_file_path = os.path.join(download_folder_path, "index.m3u8")
 
     with open(m3u8_file_path, 'wb') as file:
-        file.write(highest_quality_response.content) 
+        file.write(selected_response.content) 
 
-    merge_segments_into_mp4(m3u8_file_path, download_folder_path, title_of_output_mp4, task_id, progress)
+    merge_segments_into_mp4(m3u8_file_path, download_folder_path, output_folder_path, title_of_output_mp4, task_id, progress)
 
-def merge_segments_into_mp4(m3u8_file_path, download_folder_path, output_file_name, task_id, progress):
-    output_path = os.path.dirname(download_folder_path)
+def merge_segments_into_mp4(m3u8_file_path, download_folder_path, output_folder_path, output_file_name, task_id, progress):
 
     progress.update(task_id,  description=f"Merging segments {remove_emojis_and_binary(output_file_name)}", completed=0)
     
     nm3u8dl_command = (
-        f"n_m3u8dl-re \"{m3u8_file_path}\" --save-dir \"{output_path}\" "
+        f"n_m3u8dl-re \"{m3u8_file_path}\" --save-dir \"{download_folder_path}\" "
         f"--save-name \"{output_file_name}\" --auto-select --concurrent-download "
-        f"--del-after-done --no-log --tmp-dir \"{output_path}\" --log-level ERROR"
+        f"--del-after-done --no-log --tmp-dir \"{download_folder_path}\" --log-level ERROR"
     )
 
     pattern = re.compile(r'(\d+\.\d+%)')
-    process = subprocess.Popen(nm3u8dl_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    usage = FolderUsage(download_folder_path)
+    with span("subprocess", "n_m3u8dl-re"):
+        process = subprocess.Popen(nm3u8dl_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
 
-    while True:
-        output = process.stdout.readline()
-        if output == '' and process.poll() is not None:
-            break
-        if output:
-            stripped_output = output.strip().replace(' ', '')
-        if stripped_output.startswith('Vid'):
-            matches = pattern.findall(output)
-            if matches:
-                first_percentage = float(matches[0].replace('%', ''))
-                progress.update(task_id,  completed=first_percentage)
+        while True:
+            usage.poll()
+            output = process.stdout.readline()
+            if output == '' and process.poll() is not None:
+                break
+            if output:
+                stripped_output = output.strip().replace(' ', '')
+            if stripped_output.startswith('Vid'):
+                matches = pattern.findall(output)
+                if matches:
+                    first_percentage = float(matches[0].replace('%', ''))
+                    progress.update(task_id,  completed=first_percentage)
 
-    stdout, stderr = process.communicate()
+        stdout, stderr = process.communicate()
+    usage.poll(force=True)
 
     if stderr or process.returncode != 0:
-        progress.console.log(f"[red]Error Merging {remove_emojis_and_binary(output_file_name)}[/red] ✕")
-        progress.remove_task(task_id)
-        return
+        raise StreamDownloadError(f"n_m3u8dl-re failed to download the segments of {remove_emojis_and_binary(output_file_name)}")
     
+    for file_name in os.listdir(download_folder_path):
+        if file_name.startswith(f"{output_file_name}."):
+            finalize_file(os.path.join(download_folder_path, file_name), os.path.join(output_folder_path, file_name))
+
     progress.console.log(f"[green]Downloaded {remove_emojis_and_binary(output_file_name)}[/green] ✓")
-    progress.remove_task(task_id)
-    shutil.rmtree(download_folder_path)
\ No newline at end of file
+    progress.remove_task(task_id)
\ No newline at end of file
@@ -1,33 +1,33 @@
 import os
-import shutil
 import requests
 from constants import remove_emojis_and_binary
+from utils.disk_space import preallocate
+from utils.manifest import finalize_file
+from utils.lecture_cache import is_expired_url_error
+from utils.profiler import span
+from utils.transfer import stream_to_file
 
-def download_mp4(mp4_file_url, download_folder_path, title_of_output_mp4, task_id, progress):
+def download_mp4(mp4_file_url, download_folder_path, output_folder_path, title_of_output_mp4, task_id, progress):
     progress.update(task_id,  description=f"Downloading Video {remove_emojis_and_binary(title_of_output_mp4)}", completed=0)
-    output_path = os.path.dirname(download_folder_path)
     
     try:
-        response = requests.get(mp4_file_url, stream=True)
-        response.raise_for_status()
-        total_size = int(response.headers.get('content-length', 0))
+        with span("http", "mp4 transfer"):
+            response = requests.get(mp4_file_url, stream=True)
+            response.raise_for_status()
+            total_size = int(response.headers.get('content-length', 0))
         
-        downloaded_size = 0  
-
-        
-        output_file = os.path.join(output_path, title_of_output_mp4 + ".mp4")
-        with open(output_file, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    downloaded_size += len(chunk)  
-                    percentage = (downloaded_size / total_size) * 100
-                    progress.update(task_id, completed=percentage)
+            output_file = os.path.join(download_folder_path, title_of_output_mp4 + ".mp4")
+            with open(output_file, 'wb') as f:
+                preallocate(f, total_size)
+                writer = stream_to_file(response, f, lambda downloaded_size: progress.update(task_id, completed=(downloaded_size / total_size) * 100 if total_size else 0))
+                f.truncate(writer.size)
+        finalize_file(output_file, os.path.join(output_folder_path, title_of_output_mp4 + ".mp4"), writer.hexdigest(), writer.size)
         
         progress.update(task_id,  completed=100)
         progress.console.log(f"[green]Downloaded {remove_emojis_and_binary(title_of_output_mp4)}[/green] ✓")
         progress.remove_task(task_id)
-        shutil.rmtree(download_folder_path)
     except Exception as e:
+        if is_expired_url_error(e):
+            raise
         print(e)
         progress.console.log(f"[red]Error Downloading {remove_emojis_and_binary(title_of_output_mp4)}[/red] ✕")
\ No newline at end of file
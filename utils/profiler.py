@@ -0,0 +1,151 @@
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+from functools import wraps
+from contextlib import contextmanager, nullcontext
+from collections import Counter, defaultdict
+from constants import logger
+
+_profiler = None
+
+# From 3.12 cProfile is built on sys.monitoring, which allows one active profiler per interpreter
+SHARED_PROFILER = sys.version_info >= (3, 12)
+
+class RunProfiler:
+    def __init__(self, output_dir, interval=0.01):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.profiles = defaultdict(list)
+        self.spans = defaultdict(list)
+        self.stacks = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+        self._process_profile = None
+
+    def start(self):
+        if SHARED_PROFILER:
+            # A single profile sees every thread; the per-thread breakdown comes from the stack sampler
+            self._process_profile = cProfile.Profile()
+            self._process_profile.enable()
+        self._sampler.start()
+        return self
+
+    def _sample(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def profiled(self, func):
+        if SHARED_PROFILER:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler is already active in this interpreter
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self._lock:
+                    self.profiles[threading.current_thread().name].append(profile)
+        return wrapper
+
+    @contextmanager
+    def span(self, category, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.spans[(category, name)].append(time.perf_counter() - started)
+
+    def write_report(self):
+        self._stop.set()
+        self._sampler.join()
+        if self._process_profile is not None:
+            self._process_profile.disable()
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        with self._lock:
+            profiles = {name: list(thread_profiles) for name, thread_profiles in self.profiles.items()}
+            spans = dict(self.spans)
+
+        if self._process_profile is not None:
+            self._process_profile.dump_stats(os.path.join(self.output_dir, "process.pstats"))
+            summary = io.StringIO()
+            pstats.Stats(self._process_profile, stream=summary).sort_stats("cumulative").print_stats(50)
+            with open(os.path.join(self.output_dir, "process.txt"), "w") as f:
+                f.write(summary.getvalue())
+            self.write_thread_samples()
+
+        if profiles:
+            combined = None
+            for name, thread_profiles in profiles.items():
+                stats = pstats.Stats(*thread_profiles)
+                stats.dump_stats(os.path.join(self.output_dir, f"thread-{name.replace(' ', '_')}.pstats"))
+                if combined is None:
+                    combined = pstats.Stats(*thread_profiles)
+                else:
+                    combined.add(*thread_profiles)
+            combined.dump_stats(os.path.join(self.output_dir, "workers.pstats"))
+
+            summary = io.StringIO()
+            pstats.Stats(os.path.join(self.output_dir, "workers.pstats"), stream=summary).sort_stats("cumulative").print_stats(50)
+            with open(os.path.join(self.output_dir, "workers.txt"), "w") as f:
+                f.write(summary.getvalue())
+
+        with open(os.path.join(self.output_dir, "stacks.collapsed"), "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+        with open(os.path.join(self.output_dir, "spans.txt"), "w") as f:
+            f.write(f"{'category':<12} {'name':<40} {'count':>7} {'total s':>10} {'mean s':>9} {'max s':>9}\n")
+            for (category, name), durations in sorted(spans.items(), key=lambda item: -sum(item[1])):
+                f.write(f"{category:<12} {name[:40]:<40} {len(durations):>7} {sum(durations):>10.2f} {sum(durations) / len(durations):>9.3f} {max(durations):>9.3f}\n")
+
+        logger.info(f"The profiling report has been saved to {self.output_dir}")
+
+    def write_thread_samples(self, limit=20):
+        threads = defaultdict(Counter)
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            threads[frames[0]][frames[-1]] += count
+
+        with open(os.path.join(self.output_dir, "threads.txt"), "w") as f:
+            for name, leaves in sorted(threads.items(), key=lambda item: -item[1].total()):
+                total = leaves.total()
+                f.write(f"{name} ({total} samples, ~{total * self.interval:.2f} s)\n")
+                for leaf, count in leaves.most_common(limit):
+                    f.write(f"  {count / total * 100:6.1f}%  {leaf}\n")
+                f.write("\n")
+
+def enable_profiling(output_dir):
+    global _profiler
+    _profiler = RunProfiler(output_dir).start()
+    return _profiler
+
+def profiled(func):
+    return _profiler.profiled(func) if _profiler is not None else func
+
+def span(category, name):
+    return _profiler.span(category, name) if _profiler is not None else nullcontext()
@@ -0,0 +1,67 @@
+import threading
+from constants import format_size
+
+class QualityPolicy:
+    def __init__(self, max_height=None, max_bitrate=None, max_bytes_per_minute=None):
+        self.max_height = max_height
+        self.max_bitrate = max_bitrate
+        self.max_bytes_per_minute = max_bytes_per_minute
+
+        self.streams = 0
+        self.best_bytes = 0
+        self.selected_bytes = 0
+        self._lock = threading.Lock()
+
+    def is_limited(self):
+        return any(limit is not None for limit in (self.max_height, self.max_bitrate, self.max_bytes_per_minute))
+
+    def allows(self, playlist):
+        resolution = playlist.stream_info.resolution
+        bandwidth = playlist.stream_info.bandwidth or 0
+
+        if self.max_height is not None and resolution[1] > self.max_height:
+            return False
+        if self.max_bitrate is not None and bandwidth > self.max_bitrate:
+            return False
+        if self.max_bytes_per_minute is not None and bandwidth / 8 * 60 > self.max_bytes_per_minute:
+            return False
+        return True
+
+    def select(self, playlists, length=None):
+        candidates = [pl for pl in playlists if pl.stream_info.resolution]
+        if not candidates:
+            return None
+
+        def rank(pl):
+            return (pl.stream_info.resolution[0] * pl.stream_info.resolution[1], pl.stream_info.bandwidth or 0)
+
+        best = max(candidates, key=rank)
+        allowed = [pl for pl in candidates if self.allows(pl)]
+        # Fall back to the smallest variant when nothing satisfies the policy
+        selected = max(allowed, key=rank) if allowed else min(candidates, key=rank)
+
+        if length:
+            self.record(length, best, selected)
+
+        return selected
+
+    def record(self, length, best, selected):
+        with self._lock:
+            self.streams += 1
+            self.best_bytes += int((best.stream_info.bandwidth or 0) / 8 * length)
+            self.selected_bytes += int((selected.stream_info.bandwidth or 0) / 8 * length)
+
+    def summary(self):
+        saved = self.best_bytes - self.selected_bytes
+        percentage = (saved / self.best_bytes * 100) if self.best_bytes else 0
+        return (
+            f"Quality policy selected an estimated {format_size(self.selected_bytes)} of "
+            f"{format_size(self.best_bytes)} across {self.streams} stream(s), "
+            f"saving {format_size(saved)} ({percentage:.0f}%)"
+        )
+
+def parse_quality(value):
+    value = value.strip().lower()
+    if value.endswith("p"):
+        value = value[:-1]
+    return int(value)
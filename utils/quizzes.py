@@ -0,0 +1,42 @@
+import os
+import json
+import threading
+from constants import logger
+
+def quiz_page_urls(url, count, page_size):
+    page_count = -(-count // page_size)
+    return [f"{url}&page={page}" for page in range(2, page_count + 1)]
+
+def export_quiz(quiz, assessments, path):
+    data = {'id': quiz.id, 'title': quiz.title, 'type': quiz.quiz_type, 'assessments': assessments}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    return path
+
+class QuizCache:
+    def __init__(self, path):
+        self.path = path
+        self.assessments = {}
+        self._lock = threading.Lock()
+
+        if os.path.isfile(path):
+            try:
+                with open(path, "r") as f:
+                    self.assessments = json.load(f)
+            except json.JSONDecodeError:
+                logger.warning("The quiz cache is malformed and will be rebuilt.")
+
+    def get(self, quiz_id):
+        with self._lock:
+            return self.assessments.get(str(quiz_id))
+
+    def put(self, quiz_id, assessments):
+        with self._lock:
+            self.assessments[str(quiz_id)] = assessments
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            data = json.dumps(self.assessments)
+        with open(self.path, "w") as f:
+            f.write(data)
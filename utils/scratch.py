@@ -0,0 +1,79 @@
+import os
+import errno
+import shutil
+import socket
+from constants import logger
+from utils.disk_space import claim_disk_space
+
+SCRATCH_PREFIX = "udemy-py-"
+PARTIAL_SUFFIX = ".part"
+
+def host_name():
+    return socket.gethostname().replace(os.sep, "_")
+
+def run_scratch_dir(scratch_root):
+    # The host is part of the name because the scratch root may be shared storage used by several machines
+    return os.path.join(scratch_root, f"{SCRATCH_PREFIX}{host_name()}-{os.getpid()}")
+
+def is_process_running(pid):
+    if os.name == 'nt':
+        import ctypes
+        # PROCESS_QUERY_LIMITED_INFORMATION, os.kill would terminate the process on Windows
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def sweep_stale_scratch(scratch_root):
+    if not os.path.isdir(scratch_root):
+        return
+
+    for name in os.listdir(scratch_root):
+        if not name.startswith(SCRATCH_PREFIX):
+            continue
+        host, _, pid = name[len(SCRATCH_PREFIX):].rpartition("-")
+        # Only this host can tell whether the owning process is still running
+        if host != host_name() or not pid.isdigit():
+            continue
+        pid = int(pid)
+        if pid == os.getpid() or not is_process_running(pid):
+            logger.info(f"Removing scratch data left behind by an interrupted run: {name}")
+            shutil.rmtree(os.path.join(scratch_root, name), ignore_errors=True)
+
+def sweep_partial_files(plan):
+    for item in plan.lectures:
+        # Per-lecture temp folders were created inside the output tree by earlier versions
+        legacy_folder = os.path.join(item.folder_path, str(item.lecture.id))
+        if os.path.isdir(legacy_folder):
+            shutil.rmtree(legacy_folder, ignore_errors=True)
+
+    for folder_path in plan.folders:
+        if not os.path.isdir(folder_path):
+            continue
+        for root, _, files in os.walk(folder_path):
+            for file_name in files:
+                if file_name.endswith(PARTIAL_SUFFIX):
+                    os.remove(os.path.join(root, file_name))
+
+def finalize(source_path, destination_path):
+    os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+    try:
+        os.replace(source_path, destination_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # Different filesystems: copy next to the destination, then rename so readers never see a partial file
+        partial_path = destination_path + PARTIAL_SUFFIX
+        claim_disk_space(os.path.dirname(destination_path), os.path.getsize(source_path))
+        shutil.copyfile(source_path, partial_path)
+        os.replace(partial_path, destination_path)
+        os.remove(source_path)
+    return destination_path
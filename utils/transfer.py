@@ -0,0 +1,36 @@
+import threading
+from constants import TRANSFER_BUFFER_SIZE
+from utils.manifest import HashingWriter
+
+_buffer_size = TRANSFER_BUFFER_SIZE
+_buffers = threading.local()
+
+def set_buffer_size(size):
+    global _buffer_size
+    _buffer_size = max(int(size), 64 * 1024)
+
+def transfer_buffer():
+    # One buffer per worker thread, reused by every transfer that thread runs
+    buffer = getattr(_buffers, 'buffer', None)
+    if buffer is None or len(buffer) != _buffer_size:
+        buffer = _buffers.buffer = memoryview(bytearray(_buffer_size))
+    return buffer
+
+def stream_to_file(response, file, on_progress=None):
+    buffer = transfer_buffer()
+    writer = HashingWriter(file)
+    raw = response.raw
+    raw.decode_content = True
+
+    filled = 0
+    while True:
+        count = raw.readinto(buffer[filled:])
+        filled += count
+        # Only write full buffers, so the file sees a few large writes instead of many small ones
+        if filled and (count == 0 or filled == len(buffer)):
+            writer.write(buffer[:filled])
+            filled = 0
+            if on_progress is not None:
+                on_progress(writer.size)
+        if count == 0:
+            return writer